@@ -0,0 +1,79 @@
+import asyncio
+from calendar import timegm
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+# Async counterparts of the view decorators artax.views uses: Django 4.1's own only wrap sync views.
+
+
+def _is_authenticated(request):
+    # Resolving request.user loads the session and the user; afterwards it is cached on the request.
+    return request.user.is_authenticated
+
+
+def login_required(function=None, login_url=None):
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if await sync_to_async(_is_authenticated)(request):
+                return await view(request, *args, **kwargs)
+            return redirect_to_login(request.get_full_path(), login_url or settings.LOGIN_URL)
+
+        return wrapper
+
+    return decorator(function) if function else decorator
+
+
+def cache_control(**kwargs):
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **view_kwargs):
+            response = await view(request, *args, **view_kwargs)
+            patch_cache_control(response, **kwargs)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+async def _call(function, request, *args, **kwargs):
+    if function is None:
+        return None
+    if asyncio.iscoroutinefunction(function):
+        return await function(request, *args, **kwargs)
+    return function(request, *args, **kwargs)
+
+
+def condition(etag_func=None, last_modified_func=None):
+    """
+    Like django.views.decorators.http.condition. The functions may be sync when they only compute (they are
+    called on the event loop) or async, e.g. ``sync_to_async(f)`` for one that reads the database.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            etag = await _call(etag_func, request, *args, **kwargs)
+            etag = quote_etag(etag) if etag else None
+            last_modified = await _call(last_modified_func, request, *args, **kwargs)
+            last_modified = timegm(last_modified.utctimetuple()) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ("GET", "HEAD"):
+                if last_modified and not response.has_header("Last-Modified"):
+                    response.headers["Last-Modified"] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault("ETag", etag)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,57 @@
+import atexit
+import json
+import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes passed with ``extra=`` that end up as fields of the JSON line.
+FIELDS = ("event", "user_id", "username", "book_id", "user_agent", "before", "after", "timings")
+
+
+def snapshot(instance, fields):
+    """Field values of ``instance`` as they are now; turning them into text is left to the log listener."""
+    return {field: getattr(instance, field) for field in fields}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One compact JSON object per record. Runs on the listener thread, so this is where the user agent
+    gets parsed and snapshots get serialized rather than in the request.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if "user_agent" in entry:
+            import user_agents
+            entry["user_agent"] = str(user_agents.parse(entry["user_agent"] or ""))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False, separators=(",", ":"))
+
+
+class QueuedFileHandler(QueueHandler):
+    """
+    Hands records to a background thread that formats them as JSON and appends them to ``filename``, so a
+    slow disk or an expensive record never holds up the request that logged it.
+    """
+
+    def __init__(self, filename, encoding="utf-8"):
+        super().__init__(queue.SimpleQueue())
+        target = logging.FileHandler(filename, encoding=encoding, delay=True)
+        target.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, target)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def prepare(self, record):
+        # The queue never leaves the process, so the record travels as it is and is formatted by the listener.
+        return record
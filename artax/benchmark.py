@@ -0,0 +1,261 @@
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import date, timedelta
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from .bulk_import import BookImporter
+from .models import Author, Book, Language, Location, Type, User
+
+TYPES = (
+    ("Law", "LAW"), ("Novel", "NOV"), ("Journal", "JOU"), ("Report", "REP"), ("Thesis", "THE"),
+    ("Reference", "REF"), ("Manual", "MAN"), ("Periodical", "PER"),
+)
+LANGUAGES = (("Arabic", "ar"), ("English", "en"), ("French", "fr"), ("German", "de"), ("Spanish", "es"))
+FIRST_NAMES = ("Amal", "Karim", "Nadia", "Omar", "Rania", "Samir", "Leila", "Fadi", "Hana", "Ziad", "Maya", "Tarek")
+LAST_NAMES = ("Haddad", "Khoury", "Saad", "Nassar", "Aoun", "Rizk", "Fares", "Chami", "Daher", "Salem", "Bitar")
+WORDS = (
+    "contract", "civil", "commercial", "procedure", "criminal", "evidence", "property", "company", "labour",
+    "family", "tax", "banking", "maritime", "arbitration", "constitutional", "administrative", "insurance",
+    "obligations", "torts", "succession", "competition", "customs", "intellectual", "trademark", "treaty",
+    "jurisprudence", "commentary", "digest", "annotated", "principles", "practice", "handbook", "review",
+)
+PUBLISHERS = ("Sader", "Dalloz", "LexisNexis", "Bruylant", "Halabi", "Oxford", "Cambridge", "Sweet & Maxwell")
+
+BENCHMARK_USER = "benchmark"
+
+
+def _title(rng, number):
+    words = rng.sample(WORDS, rng.randint(2, 5))
+    # The number keeps titles unique, like the duplicate check in new_book and the importer expects.
+    return f"{' '.join(words).capitalize()} {number}"
+
+
+def catalogue_rows(rng, books, authors, locations, first_number=1):
+    """Input rows for the importer, as a cataloguer's spreadsheet would have them."""
+    registered_from = date.today() - timedelta(days=10 * 365)
+    for number in range(first_number, first_number + books):
+        book_type, _ = rng.choice(TYPES)
+        yield {
+            "title": _title(rng, number),
+            "author": rng.choice(authors),
+            "type": book_type,
+            "subject": " ".join(rng.choices(WORDS, k=rng.randint(8, 30))),
+            "section": f"{rng.choice(WORDS).capitalize()}",
+            "location": rng.choice(locations),
+            "publisher": rng.choice(PUBLISHERS),
+            "publishing_date": str(rng.randint(1950, date.today().year)),
+            "purchase_date": registered_from + timedelta(days=rng.randrange(3650)) if rng.random() < 0.6 else None,
+            "isbn": f"978{rng.randrange(10 ** 10):010d}" if rng.random() < 0.4 else None,
+            "number_of_copies": rng.choice((1, 1, 1, 2, 2, 3, 5)),
+            "language": rng.choice(LANGUAGES)[0],
+            "date_of_registration": registered_from + timedelta(days=rng.randrange(3650)),
+        }
+
+
+def generate(books, authors=5000, locations=400, seed=0, chunk_size=5000, user=None):
+    """
+    Adds ``books`` synthetic books, with the reference rows they need, through the bulk importer. The same
+    seed gives the same catalogue, so runs on different commits measure the same data.
+    """
+    rng = random.Random(seed)
+    for name, code in TYPES:
+        Type.objects.get_or_create(name=name, defaults={"code": code})
+    for name, code in LANGUAGES:
+        Language.objects.get_or_create(name=name, defaults={"code": code})
+    author_names = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {number}" for number in range(1, authors + 1)]
+    location_codes = [f"{chr(65 + number % 26)}{number // 26 + 1}-{rng.randint(1, 9)}" for number in range(locations)]
+    existing = set(Author.objects.filter(name__in=author_names).values_list("name", flat=True))
+    Author.objects.bulk_create([Author(name=name) for name in author_names if name not in existing], batch_size=1000)
+    existing = set(Location.objects.filter(code__in=location_codes).values_list("code", flat=True))
+    Location.objects.bulk_create([Location(code=code) for code in location_codes if code not in existing],
+                                 batch_size=1000)
+
+    importer = BookImporter(user=user, chunk_size=chunk_size)
+    # Continue numbering after an earlier run, so that a second run adds books rather than duplicates.
+    importer.run(catalogue_rows(rng, books, author_names, location_codes, first_number=Book.objects.count() + 1))
+    return importer
+
+
+class Benchmark:
+    """One request against the app, made through the test client so that it runs the whole middleware stack."""
+
+    def __init__(self, name, method, path, data=None, cleanup=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.cleanup = cleanup
+
+    def request(self, client, iteration):
+        data = self.data(iteration) if callable(self.data) else self.data
+        return getattr(client, self.method)(self.path, data or {})
+
+
+def benchmarks(prefix="benchmark"):
+    """The hot views, with arguments taken from a real book so that the requests find something."""
+    book = Book.objects.select_related("type", "author", "location", "language").order_by("pk").first()
+    if book is None:
+        return []
+    words = [word for word in book.title.split() if not word.isdigit()]
+
+    def new_book_form(iteration):
+        return {
+            "bookTitle": f"{prefix} {time.time_ns()} {iteration}", "bookType": book.type_id,
+            "authorName": book.author_id, "bookLocation": book.location_id or Location.objects.first().pk,
+            "bookLanguage": book.language_id or Language.objects.first().pk, "bookSection": book.section,
+            "publisher": book.publisher, "publishingYear": book.publishing_date or "", "purchaseDate": "",
+            "isbn": "", "numberOfCopies": 1, "subject": book.subject or "",
+        }
+
+    def delete_new_books():
+        Book.objects.filter(title__startswith=f"{prefix} ").delete()
+
+    url = f"books%2F{book.pk}%2F"
+    return [
+        Benchmark("all_books", "get", reverse("all_books")),
+        Benchmark("all_books_newest_first", "get", reverse("all_books"), {"asc": "False"}),
+        Benchmark("query_books_by_title", "get", reverse("query_books_by"),
+                  {"book_query_param": "title", "title": " ".join(words[:2])}),
+        Benchmark("query_books_by_type", "get", reverse("query_books_by"),
+                  {"book_query_param": "type", "type": book.type.name}),
+        Benchmark("show_book", "get", reverse("show_book", args=[book.pk])),
+        Benchmark("new_book_post", "post", reverse("new_book"), new_book_form, cleanup=delete_new_books),
+        Benchmark("generate_qr_code", "get", reverse("generate_qr_code", args=[url])),
+    ]
+
+
+def client():
+    user, created = User.objects.get_or_create(
+        username=BENCHMARK_USER,
+        defaults={"email": f"{BENCHMARK_USER}@localhost", "is_staff": True, "is_superuser": True},
+    )
+    if created:
+        user.set_unusable_password()
+        user.save()
+    browser = Client(HTTP_HOST=next((host for host in settings.ALLOWED_HOSTS if "*" not in host), "localhost"))
+    browser.force_login(user)
+    return browser
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(fraction * (len(values) - 1)))]
+
+
+def measure(benchmark, browser, iterations=20, warmup=3, cold=False):
+    """
+    Latency over ``iterations`` requests after ``warmup`` unmeasured ones, the queries of a request and its
+    peak Python memory. Memory is traced on a separate request, since tracing slows everything down.
+    ``cold`` clears the cache before every request.
+    """
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    for iteration in range(warmup):
+        if cold:
+            cache.clear()
+        benchmark.request(browser, iteration)
+
+    timings, counts, statuses = [], [], set()
+    with ExitStack() as stack:
+        # Every alias, so that reads sent to a replica are counted too.
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(count))
+        for iteration in range(warmup, warmup + iterations):
+            if cold:
+                cache.clear()
+            queries.clear()
+            start = time.perf_counter()
+            response = benchmark.request(browser, iteration)
+            timings.append((time.perf_counter() - start) * 1000)
+            counts.append(len(queries))
+            statuses.add(response.status_code)
+
+    if cold:
+        cache.clear()
+    tracemalloc.start()
+    try:
+        benchmark.request(browser, warmup + iterations)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if benchmark.cleanup:
+        benchmark.cleanup()
+
+    return {
+        "iterations": iterations,
+        "status": sorted(statuses),
+        "latency_ms": {
+            "mean": round(statistics.fmean(timings), 3),
+            "p50": round(_percentile(timings, 0.5), 3),
+            "p95": round(_percentile(timings, 0.95), 3),
+            "min": round(min(timings), 3),
+            "max": round(max(timings), 3),
+        },
+        "queries": max(counts),
+        "peak_memory_kib": round(peak / 1024, 1),
+    }
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names=None, iterations=20, warmup=3, cold=False):
+    """Runs the benchmarks (all of them, or those in ``names``) and returns the results as a JSON-ready dict."""
+    browser = client()
+    selected = [benchmark for benchmark in benchmarks() if not names or benchmark.name in names]
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "database": connection.vendor,
+        "books": Book.objects.count(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "cold": cold,
+        "results": {benchmark.name: measure(benchmark, browser, iterations, warmup, cold) for benchmark in selected},
+    }
+
+
+def save(results, path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+
+def load(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def compare(before, after):
+    """(name, p50 before, p50 after, change in %, queries before, queries after, peak KiB before, after) rows."""
+    rows = []
+    for name, result in after["results"].items():
+        old = before["results"].get(name)
+        if old is None:
+            continue
+        p50_before, p50_after = old["latency_ms"]["p50"], result["latency_ms"]["p50"]
+        change = (p50_after - p50_before) / p50_before * 100 if p50_before else 0.0
+        rows.append((name, p50_before, p50_after, change, old["queries"], result["queries"],
+                     old["peak_memory_kib"], result["peak_memory_kib"]))
+    return rows
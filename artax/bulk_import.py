@@ -0,0 +1,354 @@
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import dashboard, listings, numbering, reference, search, suggest
+from .lib_ids import lib_id_key
+from .models import Author, Book, Language, Location, Type
+
+FORMATS = ("csv", "jsonl", "xlsx")
+CHUNK_SIZE = 5000
+
+# Input columns, named after the Book fields. type/language match an existing name or code; unknown ones are
+# created only when type_code/language_code is given, since lib_ids and dropdowns depend on the code.
+COLUMNS = (
+    "lib_id", "title", "author", "type", "type_code", "subject", "section", "location", "publisher",
+    "publishing_date", "purchase_date", "isbn", "number_of_copies", "language", "language_code",
+    "date_of_registration",
+)
+REQUIRED = ("title", "author", "type", "number_of_copies")
+# COPY's marker for NULL, so that empty strings stay empty strings.
+NULL = "\\N"
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    return {"json": "jsonl", "ndjson": "jsonl"}.get(extension, extension)
+
+
+def _column(name):
+    return str(name or "").strip().lower().replace(" ", "_")
+
+
+def read_rows(path, file_format):
+    """Yields one dict per input row, without loading the file into memory."""
+    if file_format == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as file:
+            rows = csv.reader(file)
+            header = [_column(name) for name in next(rows, ())]
+            for values in rows:
+                yield dict(zip(header, values))
+    elif file_format == "jsonl":
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield {_column(key): value for key, value in json.loads(line).items()}
+    elif file_format == "xlsx":
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise RowError("Reading .xlsx files needs openpyxl (pip install openpyxl).")
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [_column(name) for name in next(rows, ())]
+            for values in rows:
+                if any(value not in (None, "") for value in values):
+                    yield dict(zip(header, values))
+        finally:
+            workbook.close()
+    else:
+        raise RowError(f"Unsupported format {file_format!r}; use one of {', '.join(FORMATS)}.")
+
+
+def _text(row, column):
+    value = row.get(column)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _date(value):
+    if value is None or isinstance(value, date):
+        return value.date() if isinstance(value, datetime) else value
+    value = str(value).strip()
+    if not value:
+        return None
+    for pattern in ("%Y-%m-%d", "%d/%m/%Y", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(value, pattern).date()
+        except ValueError:
+            pass
+    raise RowError(f"invalid date {value!r}")
+
+
+class Lookup:
+    """
+    In-memory name/code -> pk map of a reference table. ``resolve`` creates a missing row straight away;
+    ``defer`` queues it so that ``flush`` can create all of a chunk's new rows in one ``bulk_create``.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.field = fields[0]
+        self.keys = {}
+        self.pending = {}
+        self.created = 0
+        for values in model.objects.values_list("pk", *fields):
+            self._remember(values[0], values[1:])
+
+    def _remember(self, pk, values):
+        for value in values:
+            if value:
+                self.keys.setdefault(value.casefold(), pk)
+
+    def get(self, value):
+        return self.keys.get(value.casefold())
+
+    def resolve(self, value, **create):
+        pk = self.get(value)
+        if pk is None and create:
+            pk = self.model.objects.create(**create).pk
+            self.created += 1
+            self._remember(pk, create.values())
+        return pk
+
+    def defer(self, value):
+        if self.get(value) is None:
+            self.pending.setdefault(value.casefold(), value)
+
+    def flush(self):
+        if not self.pending:
+            return
+        names = list(self.pending.values())
+        self.model.objects.bulk_create([self.model(**{self.field: name}) for name in names], batch_size=1000)
+        # Not every backend returns pks from bulk_create, so read them back.
+        for pk, name in self.model.objects.filter(**{f"{self.field}__in": names}).values_list("pk", self.field):
+            self._remember(pk, (name,))
+        self.created += len(names)
+        self.pending.clear()
+
+
+class LibIdAllocator:
+    """
+    Special IDs for imported books. Explicit ones from the file are checked against those in use and push
+    the counter of their code past them; the rest are numbered from the counters, one reservation per code
+    and chunk.
+    """
+
+    def __init__(self):
+        self.codes = dict(Type.objects.values_list("pk", "code"))
+        self.counted = {numbering.counter_code(code) for code in self.codes.values()}
+        self.taken = set(Book.objects.values_list("lib_id", flat=True).iterator(chunk_size=10000))
+        self.explicit = {}
+
+    def code(self, type_id):
+        if type_id not in self.codes:
+            self.codes[type_id] = Type.objects.values_list("code", flat=True).get(pk=type_id)
+            self.counted.add(numbering.counter_code(self.codes[type_id]))
+        return self.codes[type_id]
+
+    def take(self, lib_id, type_id):
+        self.taken.add(lib_id)
+        self.code(type_id)
+        prefix, number = lib_id_key(lib_id)
+        # Whatever the type of the book, the counter of the ID's code must not hand the number out again.
+        if prefix in self.counted:
+            self.explicit[prefix] = max(self.explicit.get(prefix, 0), number)
+
+    def assign(self, rows):
+        """Fills in the missing lib_ids of a chunk's rows; runs inside the chunk's transaction."""
+        for code, number in self.explicit.items():
+            numbering.advance(code, number)
+        self.explicit.clear()
+
+        pending = {}
+        for values in rows:
+            if values["lib_id"] is None:
+                pending.setdefault(values["type_id"], []).append(values)
+        for type_id, group in pending.items():
+            code = self.code(type_id)
+            lib_ids = []
+            while len(lib_ids) < len(group):
+                count = len(group) - len(lib_ids)
+                first = numbering.allocate(code, count)
+                lib_ids += [f"{code}{number}" for number in range(first, first + count)
+                            if f"{code}{number}" not in self.taken]
+            for values, lib_id in zip(group, lib_ids):
+                values["lib_id"] = lib_id
+                self.taken.add(lib_id)
+
+
+def can_copy():
+    # psycopg2 cursors have copy_expert; anything else goes through bulk_create.
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        return hasattr(cursor.cursor, "copy_expert")
+
+
+def copy_books(rows):
+    """
+    Writes Book rows (dicts keyed by field attname) with one PostgreSQL ``COPY ... FROM STDIN``. Unlike
+    ``bulk_create`` this builds no model instances and prepares no values per field, which is where the time
+    goes at this volume, so the values must already be database-ready.
+    """
+    fields = [field for field in Book._meta.concrete_fields if not field.primary_key]
+    defaults = {field.attname: field.get_default() for field in fields}
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        row = {**defaults, **row}
+        writer.writerow([NULL if row[field.attname] is None else row[field.attname] for field in fields])
+    buffer.seek(0)
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(
+            f"COPY {Book._meta.db_table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{NULL}')", buffer)
+
+
+class BookImporter:
+    """
+    Turns input rows into Book field values and writes them in chunks, one transaction per chunk, with COPY
+    on PostgreSQL and ``bulk_create`` elsewhere. Reference tables and the titles and lib_ids in use are held
+    in memory; new authors/locations are created and lib_ids reserved once per chunk, so a row costs no
+    queries of its own. Rows whose title is already in the catalogue (or earlier in the file) are skipped
+    like in ``new_book``.
+    """
+
+    def __init__(self, user=None, chunk_size=CHUNK_SIZE, dry_run=False, copy=None):
+        self.user_id = user.pk if user else None
+        self.copy = can_copy() if copy is None else copy
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.authors = Lookup(Author, ("name",))
+        self.types = Lookup(Type, ("code", "name"))
+        self.locations = Lookup(Location, ("code",))
+        self.languages = Lookup(Language, ("code", "name"))
+        self.lib_ids = LibIdAllocator()
+        self.titles = set(Book.objects.values_list("title", flat=True).iterator(chunk_size=10000))
+        self.now = timezone.now()
+        self.imported = 0
+        self.duplicates = 0
+        self.errors = []
+
+    def build(self, row):
+        missing = [column for column in REQUIRED if not _text(row, column)]
+        if missing:
+            raise RowError(f"missing {', '.join(missing)}")
+        title = _text(row, "title")
+        if title in self.titles:
+            return None
+        try:
+            copies = int(float(_text(row, "number_of_copies")))
+        except ValueError:
+            raise RowError(f"invalid number_of_copies {row.get('number_of_copies')!r}")
+        purchase_date = _date(row.get("purchase_date"))
+        registered = _date(row.get("date_of_registration")) or date.today()
+        lib_id = _text(row, "lib_id")
+        if lib_id is not None and lib_id in self.lib_ids.taken:
+            raise RowError(f"lib_id {lib_id} is already in use")
+
+        type_name, type_code = _text(row, "type"), _text(row, "type_code")
+        if self.types.get(type_name) is None and not type_code:
+            raise RowError(f"unknown type {type_name!r} (add a type_code column to create it)")
+        language, language_code = _text(row, "language"), _text(row, "language_code")
+        if language and self.languages.get(language) is None and not language_code:
+            raise RowError(f"unknown language {language!r} (add a language_code column to create it)")
+
+        # Nothing below rejects the row, so reference rows are only created for books that get written.
+        type_id = (self.types.resolve(type_name, name=type_name, code=type_code) if type_code
+                   else self.types.get(type_name))
+        language_id = None
+        if language:
+            language_id = (self.languages.resolve(language, name=language, code=language_code) if language_code
+                           else self.languages.get(language))
+        author, location = _text(row, "author"), _text(row, "location")
+
+        if lib_id is not None:
+            self.lib_ids.take(lib_id, type_id)
+        self.titles.add(title)
+        self.authors.defer(author)
+        if location:
+            self.locations.defer(location)
+        values = {
+            "lib_id": lib_id,
+            "title": title,
+            "type_id": type_id,
+            "subject": _text(row, "subject"),
+            "section": _text(row, "section") or "",
+            "publisher": _text(row, "publisher") or "",
+            "publishing_date": _text(row, "publishing_date"),
+            "purchase_date": purchase_date,
+            "isbn": _text(row, "isbn"),
+            "number_of_copies": copies,
+            "language_id": language_id,
+            "date_of_registration": registered,
+            "registrator_id": self.user_id,
+            "last_editor_id": self.user_id,
+            "last_edit_time": self.now,
+        }
+        return values, author, location
+
+    def _write(self, books):
+        self.authors.flush()
+        self.locations.flush()
+        rows = []
+        for values, author, location in books:
+            values["author_id"] = self.authors.get(author)
+            values["location_id"] = self.locations.get(location) if location else None
+            rows.append(values)
+        self.lib_ids.assign(rows)
+        if rows and not self.dry_run:
+            if self.copy:
+                copy_books(rows)
+            else:
+                Book.objects.bulk_create([Book(**values) for values in rows], batch_size=1000)
+        self.imported += len(rows)
+
+    def run(self, rows):
+        first_new_id = (Book.objects.order_by("-pk").values_list("pk", flat=True).first() or 0) + 1
+        rows = iter(rows)
+        number = 0
+        while True:
+            # Reference rows created for a chunk commit or roll back together with its books.
+            with transaction.atomic():
+                books = []
+                for row in rows:
+                    number += 1
+                    try:
+                        book = self.build(row)
+                    except RowError as error:
+                        self.errors.append((number, str(error)))
+                        continue
+                    if book is None:
+                        self.duplicates += 1
+                        continue
+                    books.append(book)
+                    if len(books) >= self.chunk_size:
+                        break
+                self._write(books)
+                if self.dry_run:
+                    transaction.set_rollback(True)
+            if len(books) < self.chunk_size:
+                break
+
+        # bulk_create does not send post_save, so do once what the signal receivers would do per book.
+        if self.imported and not self.dry_run:
+            with transaction.atomic():
+                search.index_books_from(first_new_id)
+                dashboard.reconcile()
+            suggest.invalidate()
+            reference.invalidate()
+            listings.invalidate()
+        return self.imported
@@ -0,0 +1,18 @@
+import time
+
+from django.core.cache import cache
+
+# When a generation was last bumped, i.e. when a write last committed (see artax.routers.filling_cache).
+CHANGED_KEY = "artax:changed"
+
+
+def generation(key):
+    return cache.get_or_set(key, 0, None)
+
+
+def bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+    cache.set(CHANGED_KEY, time.time(), None)
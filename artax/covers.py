@@ -0,0 +1,65 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Widths of the WebP renditions stored next to each cover (e.g. cover/12-cover.480w.webp).
+VARIANT_WIDTHS = (160, 480, 1200)
+WEBP_QUALITY = 80
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="covers")
+
+
+def variant_name(name, width):
+    root, _ = os.path.splitext(name)
+    return f"{root}.{width}w.webp"
+
+
+def variants(name):
+    """(url, width) of the renditions of cover ``name`` that exist, smallest first."""
+    if not name:
+        return []
+    return [(default_storage.url(variant_name(name, width)), width) for width in VARIANT_WIDTHS
+            if default_storage.exists(variant_name(name, width))]
+
+
+def generate(name):
+    with default_storage.open(name, "rb") as file:
+        original = ImageOps.exif_transpose(Image.open(file))
+        original.load()
+    if original.mode not in ("RGB", "RGBA"):
+        original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+
+    for width in VARIANT_WIDTHS:
+        image = original.copy()
+        # Never upscale: a narrow original is re-encoded at its own size.
+        image.thumbnail((width, width * 4), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=4)
+        target = variant_name(name, width)
+        default_storage.delete(target)
+        default_storage.save(target, ContentFile(buffer.getvalue()))
+
+
+def _generate_logged(name):
+    try:
+        generate(name)
+    except Exception:
+        logger.exception("Could not generate cover renditions for %s", name)
+
+
+def schedule(name):
+    """Generates the renditions on a background thread once the surrounding transaction has committed."""
+    transaction.on_commit(lambda: _executor.submit(_generate_logged, name))
+
+
+def delete(name):
+    for width in VARIANT_WIDTHS:
+        default_storage.delete(variant_name(name, width))
@@ -0,0 +1,185 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from . import reference
+from .models import Book, BookRevision, CatalogueStat, User
+
+# Book columns each dashboard breakdown is counted by; "total" is the whole catalogue under the key "".
+DIMENSIONS = {
+    "type": "type_id",
+    "location": "location_id",
+    "language": "language_id",
+    "registrator": "registrator_id",
+    "month": "date_of_registration",
+}
+FIELDS = (*DIMENSIONS.values(), "number_of_copies")
+TOP = 5
+MONTHS = 12
+
+
+def _key(dimension, value):
+    if value is None:
+        return ""
+    if dimension == "month":
+        return f"{value.year:04d}-{value.month:02d}"
+    return str(value)
+
+
+def values(book):
+    """The counted columns of an in-memory ``book``, cleaned the way they will be stored."""
+    return {name: Book._meta.get_field(name).to_python(getattr(book, name)) for name in FIELDS}
+
+
+def stored(book_id):
+    """The counted columns of a book as they are in the database, or None for a book not saved yet."""
+    if book_id is None:
+        return None
+    return Book.objects.filter(pk=book_id).values(*FIELDS).first()
+
+
+def before_save(book):
+    """
+    The counted columns of ``book`` as it was loaded or last saved (Book.from_db keeps them), so that a save
+    needs no query: None for a book not saved yet, and only one loaded with some of them deferred is read.
+    """
+    if book.pk is None:
+        return None
+    loaded = getattr(book, "_loaded_values", {})
+    if all(name in loaded for name in FIELDS):
+        return {name: loaded[name] for name in FIELDS}
+    return stored(book.pk)
+
+
+def counts_change(update_fields):
+    """Whether a save of ``update_fields`` (None for all of them) can change the figures."""
+    return update_fields is None or any(Book._meta.get_field(name).attname in FIELDS for name in update_fields)
+
+
+def _contributions(row, sign):
+    copies = sign * (row["number_of_copies"] or 0)
+    yield ("total", ""), sign, copies
+    for dimension, name in DIMENSIONS.items():
+        yield (dimension, _key(dimension, row[name])), sign, copies
+
+
+def _add(dimension, key, books, copies):
+    counted = CatalogueStat.objects.filter(dimension=dimension, key=key)
+    if counted.update(books=F("books") + books, copies=F("copies") + copies):
+        return
+    try:
+        with transaction.atomic():
+            CatalogueStat.objects.create(dimension=dimension, key=key, books=books, copies=copies)
+    except IntegrityError:
+        # Someone else created the row in the meantime; add to theirs.
+        counted.update(books=F("books") + books, copies=F("copies") + copies)
+
+
+def record_change(before, after):
+    """
+    Moves a book's counts from the figures of row ``before`` to those of row ``after`` (either may be None
+    for a created or deleted book). Figures the edit leaves unchanged are not written at all.
+    """
+    books, copies = Counter(), Counter()
+    for row, sign in ((before, -1), (after, 1)):
+        if row is not None:
+            for figure, book_delta, copies_delta in _contributions(row, sign):
+                books[figure] += book_delta
+                copies[figure] += copies_delta
+    changed = {figure: (books[figure], copies[figure]) for figure in books if books[figure] or copies[figure]}
+    if changed:
+        # Once the write has committed, in a short transaction of its own: every insert adds to the "total"
+        # row, and updating it in the writer's transaction would hold its lock until that commits.
+        transaction.on_commit(lambda: _apply(changed))
+
+
+def _apply(changed):
+    with transaction.atomic():
+        # In a fixed order, so that two writers never wait on each other's rows.
+        for figure in sorted(changed):
+            _add(*figure, *changed[figure])
+
+
+def forget(dimension, key):
+    """Folds the figure of a deleted language or user into "none", as SET_NULL does to its books."""
+    with transaction.atomic():
+        removed = CatalogueStat.objects.filter(dimension=dimension, key=str(key)).first()
+        if removed is not None:
+            removed.delete()
+            _add(dimension, "", removed.books, removed.copies)
+
+
+def count(books):
+    """{(dimension, key): (books, copies)} of a Book queryset, with one GROUP BY per breakdown."""
+    books = books.order_by()
+    totals = books.aggregate(books=Count("pk"), copies=Sum("number_of_copies"))
+    figures = {("total", ""): (totals["books"], totals["copies"] or 0)}
+    for dimension, name in DIMENSIONS.items():
+        grouped = books.annotate(value=TruncMonth(name) if dimension == "month" else F(name))
+        for row in grouped.values("value").annotate(books=Count("pk"), copies=Sum("number_of_copies")):
+            figures[dimension, _key(dimension, row["value"])] = (row["books"], row["copies"] or 0)
+    return figures
+
+
+def uncount(books):
+    """Takes a whole queryset of books about to be deleted off the figures, rather than one book at a time."""
+    with transaction.atomic():
+        for (dimension, key), (book_count, copies) in count(books).items():
+            if book_count:
+                _add(dimension, key, -book_count, -copies)
+
+
+def reconcile():
+    """
+    Replaces the running figures with a full recount, for after writes that send no signals (bulk imports,
+    raw SQL) or to repair drift. Returns the number of figures that had drifted.
+    """
+    with transaction.atomic():
+        fresh = count(Book.objects.all())
+        current = {(stat.dimension, stat.key): (stat.books, stat.copies) for stat in CatalogueStat.objects.all()}
+        drifted = sum(1 for figure in current.keys() | fresh.keys()
+                      if current.get(figure, (0, 0)) != fresh.get(figure, (0, 0)))
+        CatalogueStat.objects.all().delete()
+        CatalogueStat.objects.bulk_create(CatalogueStat(dimension=dimension, key=key, books=books, copies=copies)
+                                          for (dimension, key), (books, copies) in fresh.items())
+    return drifted
+
+
+def _breakdown(figures, table, label):
+    """(label, books, copies) of a breakdown, largest first; books with no value are listed as "None"."""
+    labels = {str(row.pk): getattr(row, label) for row in reference.get(table)}
+    rows = [(labels.get(key, "None") if key else "None", books, copies) for key, (books, copies) in figures.items()]
+    return sorted(rows, key=lambda row: (-row[1], row[0]))
+
+
+def context():
+    """
+    Everything the dashboard shows. The counts come from the running figures and the lists from
+    indexed "latest N" queries, so the cost of a page load does not grow with the catalogue.
+    """
+    figures = {}
+    for stat in CatalogueStat.objects.filter(books__gt=0):
+        figures.setdefault(stat.dimension, {})[stat.key] = (stat.books, stat.copies)
+    total_books, total_copies = figures.get("total", {}).get("", (0, 0))
+
+    top = sorted(((books, key) for key, (books, _) in figures.get("registrator", {}).items() if key),
+                 reverse=True)[:TOP]
+    users = User.objects.in_bulk([int(key) for _, key in top])
+    registrators = [(users[int(key)], books) for books, key in top if int(key) in users]
+
+    months = sorted(figures.get("month", {}).items())[-MONTHS:]
+    return {
+        "total_books": total_books,
+        "total_copies": total_copies,
+        "breakdowns": [
+            ("Books by Type", _breakdown(figures.get("type", {}), "types", "name")),
+            ("Books by Location", _breakdown(figures.get("location", {}), "locations", "code")),
+            ("Books by Language", _breakdown(figures.get("language", {}), "languages", "name")),
+        ],
+        "registrators": registrators,
+        "months": [(month, books) for month, (books, _) in months],
+        "recent_books": Book.objects.for_listing().order_by("-pk")[:TOP],
+        "recent_revisions": BookRevision.objects.select_related("book", "editor").order_by("-edited_at")[:TOP],
+    }
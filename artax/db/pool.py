@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from collections import deque
+
+from django.db.utils import OperationalError
+
+from .. import metrics
+
+CONNECTIONS = metrics.Gauge(metrics.registry, "artax_db_pool_connections",
+                            "Open pooled database connections, by alias and whether they are idle or in use.",
+                            ("alias", "state"))
+MAX_SIZE = metrics.Gauge(metrics.registry, "artax_db_pool_max_size", "Most connections a pool may open, by alias.",
+                         ("alias",))
+CHECKOUT = metrics.Histogram(metrics.registry, "artax_db_pool_checkout_seconds",
+                             "Time to hand out a connection, including waits, health checks and new connections.",
+                             ("alias",), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1, 5))
+WAIT = metrics.Histogram(metrics.registry, "artax_db_pool_wait_seconds",
+                         "Time spent waiting for a connection to be returned, when all of them were in use.",
+                         ("alias",), buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10))
+TIMEOUTS = metrics.Counter(metrics.registry, "artax_db_pool_timeouts_total",
+                           "Checkouts that gave up waiting for a connection.", ("alias",))
+CONNECTS = metrics.Counter(metrics.registry, "artax_db_pool_connects_total", "New database connections opened.",
+                           ("alias",))
+DISCARDS = metrics.Counter(metrics.registry, "artax_db_pool_discards_total",
+                           "Connections closed by the pool, by reason: broken, expired or idle.", ("alias", "reason"))
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class PooledConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.created = self.used = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Database connections shared by all threads of a process. A checkout takes the most recently returned
+    idle connection, opens a new one while fewer than ``max_size`` are open, or waits up to ``timeout``
+    seconds for one to come back. Connections idle for ``check_after`` seconds are pinged before reuse;
+    those older than ``max_lifetime`` or idle longer than ``max_idle`` are closed instead.
+    """
+
+    def __init__(self, alias, connect, ping, max_size=10, timeout=10.0, check_after=30, max_idle=300,
+                 max_lifetime=1800):
+        self.alias = alias
+        self.connect = connect
+        self.ping = ping
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.idle = deque()
+        self.size = 0
+        self.condition = threading.Condition()
+        MAX_SIZE.set(max_size, alias)
+        self._report()
+
+    def _report(self):
+        CONNECTIONS.set(len(self.idle), self.alias, "idle")
+        CONNECTIONS.set(self.size - len(self.idle), self.alias, "in_use")
+
+    def _discard(self, pooled, reason):
+        # Called with the condition held; the slot is free again for whoever is waiting.
+        self.size -= 1
+        self.condition.notify()
+        DISCARDS.inc(self.alias, reason)
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+
+    def checkout(self):
+        began = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        waited = None
+        while True:
+            pooled = None
+            with self.condition:
+                while pooled is None:
+                    now = time.monotonic()
+                    if self.idle:
+                        pooled = self.idle.pop()
+                        if now - pooled.created > self.max_lifetime or now - pooled.used > self.max_idle:
+                            self._discard(pooled, "expired" if now - pooled.created > self.max_lifetime else "idle")
+                            pooled = None
+                    elif self.size < self.max_size:
+                        self.size += 1
+                        break
+                    else:
+                        waited = waited or now
+                        if now >= deadline:
+                            TIMEOUTS.inc(self.alias)
+                            self._report()
+                            raise PoolTimeout(f"No {self.alias} database connection was free within {self.timeout}s "
+                                              f"(all {self.max_size} in use).")
+                        self.condition.wait(deadline - now)
+                self._report()
+
+            if pooled is None:
+                try:
+                    pooled = PooledConnection(self.connect())
+                except BaseException:
+                    with self.condition:
+                        self.size -= 1
+                        self.condition.notify()
+                        self._report()
+                    raise
+                CONNECTS.inc(self.alias)
+            elif time.monotonic() - pooled.used > self.check_after and not self.ping(pooled.connection):
+                with self.condition:
+                    self._discard(pooled, "broken")
+                    self._report()
+                continue
+            break
+
+        if waited is not None:
+            WAIT.observe(time.monotonic() - waited, self.alias)
+        CHECKOUT.observe(time.perf_counter() - began, self.alias)
+        return pooled
+
+    def checkin(self, pooled, reusable=True):
+        with self.condition:
+            if not reusable:
+                self._discard(pooled, "broken")
+            elif time.monotonic() - pooled.created > self.max_lifetime:
+                self._discard(pooled, "expired")
+            else:
+                pooled.used = time.monotonic()
+                self.idle.append(pooled)
+                self.condition.notify()
+            self._report()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_for(key, factory):
+    """The pool under ``key`` in this process; one made before a fork is left to the parent, unclosed."""
+    with _pools_lock:
+        pid, pool = _pools.get(key, (None, None))
+        if pid != os.getpid():
+            pool = factory()
+            _pools[key] = (os.getpid(), pool)
+        return pool
+
+
+class PooledDatabaseWrapper:
+    """
+    Mixin for a backend's DatabaseWrapper that takes connections from a ConnectionPool instead of opening
+    them, and returns them instead of closing them. Configured by the "POOL" dict of the DATABASES entry:
+    MAX_SIZE, TIMEOUT, CHECK_AFTER, MAX_IDLE and MAX_LIFETIME (seconds), the keyword arguments of the pool.
+    Subclasses provide ``ping(connection)``.
+    """
+
+    pool = pooled = None
+
+    def get_pool(self, conn_params):
+        settings_dict = self.settings_dict
+        key = (self.alias, *(settings_dict.get(name) for name in ("ENGINE", "NAME", "HOST", "PORT", "USER")))
+        options = {name.lower(): value for name, value in settings_dict.get("POOL", {}).items()}
+        return pool_for(key, lambda: ConnectionPool(
+            self.alias, lambda: super(PooledDatabaseWrapper, self).get_new_connection(conn_params), self.ping,
+            **options,
+        ))
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        self.pooled = self.pool.checkout()
+        return self.pooled.connection
+
+    def _close(self):
+        if self.connection is None or self.pooled is None:
+            return super()._close()
+        pool, pooled, self.pooled = self.pool, self.pooled, None
+        # A connection closed inside atomic() stays referenced by this wrapper until the block exits, so it
+        # must not be handed to anyone else; neither may one whose state is unknown.
+        reusable = not self.in_atomic_block
+        if reusable:
+            try:
+                with self.wrap_database_errors:
+                    self.connection.rollback()
+            except Exception:
+                reusable = False
+        pool.checkin(pooled, reusable)
@@ -0,0 +1,15 @@
+from django.db.backends.postgresql import base
+
+from ..pool import PooledDatabaseWrapper
+
+
+class DatabaseWrapper(PooledDatabaseWrapper, base.DatabaseWrapper):
+    def ping(self, connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except base.Database.Error:
+            return False
@@ -0,0 +1,13 @@
+from django.db.backends.sqlite3 import base
+
+from ..pool import PooledDatabaseWrapper
+
+
+# Stand-in for the pooled PostgreSQL backend in development and tests; SQLite connections are cheap to open.
+class DatabaseWrapper(PooledDatabaseWrapper, base.DatabaseWrapper):
+    def ping(self, connection):
+        try:
+            connection.execute("SELECT 1")
+            return True
+        except base.Database.Error:
+            return False
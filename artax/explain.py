@@ -0,0 +1,45 @@
+from django.db import connection
+
+from . import dashboard, search
+from .models import Book
+
+# A listing page of 35 plus the row that tells whether there is a next one.
+PAGE_ROWS = 36
+
+
+def sample():
+    """Field values of a real book, so that the plans are for lookups that find something."""
+    books = Book.objects.select_related("type").order_by("-pk")
+    book = books.exclude(isbn=None).exclude(isbn="").first() or books.first()
+    if book is None:
+        return None
+    words = search.tokenize(book.title)
+    return {
+        "lib_id": book.lib_id, "title": book.title, "isbn": book.isbn or "", "type": book.type.name,
+        "word": max(words, key=len) if words else "",
+    }
+
+
+def queries(values):
+    """(description, queryset) of the app's book queries, built the way the views and modules build them."""
+    yield "query_books_by: special ID", Book.objects.filter(lib_id=values["lib_id"])
+    yield "new_book: duplicate title check", Book.objects.filter(title=values["title"]).values("pk")[:1]
+    yield "ISBN lookup", Book.objects.filter(isbn=values["isbn"])
+    yield "all_books: first page", Book.objects.for_listing().order_by("pk")[:PAGE_ROWS]
+    yield "all_books: newest first", Book.objects.for_listing().order_by("-pk")[:PAGE_ROWS]
+    books, _ = search.query_books(Book.objects.for_listing(), {"type": values["type"]})
+    yield "query_books_by: type dropdown", books.order_by("pk")[:PAGE_ROWS]
+    books, _ = search.query_books(Book.objects.for_listing(), {"title": values["word"]})
+    yield "query_books_by: title search", books.order_by("-rank", "-pk")[:PAGE_ROWS]
+    yield "dashboard: recent registrations", Book.objects.for_listing().order_by("-pk")[:dashboard.TOP]
+
+
+def plans(analyze=False):
+    """(description, plan) of every query in ``queries``; ``analyze`` runs them too, where the backend can."""
+    values = sample()
+    if values is None:
+        return
+    # Only PostgreSQL and MySQL take EXPLAIN options.
+    options = {"analyze": True} if analyze and connection.vendor in ("postgresql", "mysql") else {}
+    for description, queryset in queries(values):
+        yield description, queryset.explain(**options)
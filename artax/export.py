@@ -0,0 +1,223 @@
+import csv
+import json
+import re
+import tempfile
+import zipfile
+from datetime import date
+from xml.sax.saxutils import escape
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+CHUNK_SIZE = 2000
+
+# (header, value lookup) of each exported column; related names are joined in by the same query.
+COLUMNS = (
+    ("id", "id"),
+    ("lib_id", "lib_id"),
+    ("title", "title"),
+    ("author", "author__name"),
+    ("type", "type__name"),
+    ("type_code", "type__code"),
+    ("subject", "subject"),
+    ("section", "section"),
+    ("location", "location__code"),
+    ("publisher", "publisher"),
+    ("publishing_date", "publishing_date"),
+    ("purchase_date", "purchase_date"),
+    ("isbn", "isbn"),
+    ("number_of_copies", "number_of_copies"),
+    ("language", "language__name"),
+    ("language_code", "language__code"),
+    ("date_of_registration", "date_of_registration"),
+)
+HEADER = [name for name, _ in COLUMNS]
+
+# Text that spreadsheet applications read as a formula (tab and CR start one after a field separator).
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+# Control characters that XML 1.0 does not allow even escaped.
+XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def rows(queryset):
+    """
+    Tuples of the exported columns in pk order, read through a server-side cursor (where the backend has
+    one) ``CHUNK_SIZE`` rows at a time, so memory does not grow with the catalogue.
+    """
+    queryset = queryset.order_by("pk").values_list(*(lookup for _, lookup in COLUMNS))
+    return queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+def _text(value):
+    if value is None:
+        return ""
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+
+def _csv_text(value):
+    # Quoted as text, so that a title like "=HYPERLINK(...)" is not run when the export is opened.
+    text = _text(value)
+    return "'" + text if isinstance(value, str) and text.startswith(FORMULA_PREFIXES) else text
+
+
+class _Buffer:
+    """File-like sink that hands back whatever was written since the last ``take``."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data) if not isinstance(data, str) else data.encode("utf-8"))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _batches(values, size=CHUNK_SIZE):
+    batch = []
+    for value in values:
+        batch.append(value)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_csv(values):
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    # A BOM so that Excel opens the file as UTF-8.
+    yield "\ufeff".encode("utf-8")
+    writer.writerow(HEADER)
+    for batch in _batches(values):
+        writer.writerows([[_csv_text(value) for value in row] for row in batch])
+        yield buffer.take()
+    yield buffer.take()
+
+
+def stream_jsonl(values):
+    for batch in _batches(values):
+        yield "".join(json.dumps(dict(zip(HEADER, row)), default=_text, ensure_ascii=False) + "\n"
+                      for row in batch).encode("utf-8")
+
+
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Books" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '<Relationship Id="rId2" Target="styles.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+        '</Relationships>'
+    ),
+    # Cell style 1 is the quote prefix: the cell shows its text as is and stays text when edited.
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0" quotePrefix="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f"<c><v>{value}</v></c>")
+        elif value is not None:
+            text = XML_ILLEGAL.sub("", _text(value))
+            style = ' s="1"' if text.startswith(FORMULA_PREFIXES) else ""
+            cells.append(f'<c t="inlineStr"{style}><is><t xml:space="preserve">{escape(text)}</t></is></c>')
+        else:
+            cells.append("<c/>")
+    return f"<row>{''.join(cells)}</row>"
+
+
+def stream_xlsx(values):
+    """
+    A single-sheet workbook written straight into a zip stream: cells are inline strings, so there is no
+    shared string table to hold in memory, and the sheet is deflated and sent as it is produced.
+    """
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        yield buffer.take()
+        with workbook.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                         '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                         f'<sheetData>{_xlsx_row(HEADER)}').encode("utf-8"))
+            for batch in _batches(values):
+                sheet.write("".join(_xlsx_row(row) for row in batch).encode("utf-8"))
+                yield buffer.take()
+            sheet.write(b"</sheetData></worksheet>")
+    yield buffer.take()
+
+
+WRITERS = {
+    "csv": stream_csv,
+    "jsonl": stream_jsonl,
+    "xlsx": stream_xlsx,
+}
+
+
+def export(queryset, export_format):
+    """The catalogue rows of ``queryset`` as a stream of bytes in ``export_format``."""
+    return WRITERS[export_format](rows(queryset))
+
+
+def spool(queryset, export_format):
+    """
+    The export written out to a temporary file, rewound for reading. Under ASGI, Django 4.1 iterates a
+    streaming response on the event loop, where the rows cannot be read from the database.
+    """
+    file = tempfile.TemporaryFile()
+    for chunk in export(queryset, export_format):
+        file.write(chunk)
+    file.seek(0)
+    return file
@@ -0,0 +1,153 @@
+import io
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+
+from . import processes
+from .lib_ids import lib_id_key
+from .qr import QR_OPTIONS
+
+# A4 at 150 dpi, cut into a 4 x 7 grid of shelf labels.
+PAGE_SIZE = (1240, 1754)
+PAGE_POINTS = (595.28, 841.89)
+COLUMNS, ROWS = 4, 7
+LABELS_PER_PAGE = COLUMNS * ROWS
+MARGIN = 40
+QR_BOX_SIZE = 5
+TITLE_LENGTH = 28
+
+_executor = None
+
+
+def select_books(queryset, lib_from=None, lib_to=None, location=None, book_type=None):
+    """
+    Books to label, in shelf order. ``lib_from``/``lib_to`` bound the run by lib_id (e.g. LAW1 to LAW250,
+    compared numerically within the type code), ``location`` and ``book_type`` are exact codes.
+    """
+    queryset = queryset.select_related("type").only("id", "lib_id", "title", "type__code")
+    if location:
+        queryset = queryset.filter(location__code=location)
+    if book_type:
+        queryset = queryset.filter(type__code=book_type)
+    lower = lib_id_key(lib_from) if lib_from else None
+    upper = lib_id_key(lib_to) if lib_to else None
+    for prefix in {bound[0] for bound in (lower, upper) if bound and bound[0]}:
+        queryset = queryset.filter(type__code__iexact=prefix)
+
+    books = [book for book in queryset.iterator(chunk_size=2000)
+             if (lower is None or lib_id_key(book.lib_id) >= lower) and (upper is None or lib_id_key(book.lib_id) <= upper)]
+    books.sort(key=lambda book: lib_id_key(book.lib_id))
+    return books
+
+
+def labels_for(books, host):
+    return [(f"{host}/books/{book.id}/", book.lib_id, book.title) for book in books]
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def render_sheet(labels):
+    """One page of labels as a greyscale image. Runs in a worker process, so it only gets plain data."""
+    page = Image.new("L", PAGE_SIZE, 255)
+    draw = ImageDraw.Draw(page)
+    id_font, title_font = _font(26), _font(16)
+    cell_width = (PAGE_SIZE[0] - 2 * MARGIN) // COLUMNS
+    cell_height = (PAGE_SIZE[1] - 2 * MARGIN) // ROWS
+
+    for index, (payload, lib_id, title) in enumerate(labels):
+        left = MARGIN + (index % COLUMNS) * cell_width
+        top = MARGIN + (index // COLUMNS) * cell_height
+        qr = qrcode.QRCode(**{**QR_OPTIONS, "box_size": QR_BOX_SIZE, "border": 1})
+        qr.add_data(payload)
+        qr.make(fit=True)
+        code = qr.make_image(fill_color="black", back_color="white").get_image().convert("L")
+        page.paste(code, (left + (cell_width - code.width) // 2, top + 8))
+        text_top = top + 12 + code.height
+        draw.text((left + cell_width // 2, text_top), lib_id, font=id_font, fill=0, anchor="mt")
+        if len(title) > TITLE_LENGTH:
+            title = title[:TITLE_LENGTH - 1] + "…"
+        draw.text((left + cell_width // 2, text_top + 32), title, font=title_font, fill=0, anchor="mt")
+        draw.rectangle((left, top, left + cell_width - 1, top + cell_height - 1), outline=200)
+    return page
+
+
+def render_pdf_page(labels):
+    page = render_sheet(labels)
+    return page.width, page.height, zlib.compress(page.tobytes(), 6)
+
+
+def render_png_page(labels):
+    buffer = io.BytesIO()
+    render_sheet(labels).save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def pages(labels):
+    return [labels[i:i + LABELS_PER_PAGE] for i in range(0, len(labels), LABELS_PER_PAGE)]
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 4), mp_context=processes.context())
+    return _executor
+
+
+def stream_pdf(page_images):
+    """
+    Writes a PDF incrementally from (width, height, deflated greyscale pixels) tuples, yielding each
+    page as soon as it is available. The page tree (object 2) is referenced up front and written last.
+    """
+    offsets = {}
+    position = 0
+
+    def emit(number, body):
+        nonlocal position
+        offsets[number] = position
+        chunk = f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n"
+        position += len(chunk)
+        return chunk
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position = len(header)
+    yield header
+    yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    kids = []
+    number = 3
+    for width, height, pixels in page_images:
+        image, content, page = number, number + 1, number + 2
+        number += 3
+        kids.append(page)
+        drawing = f"q {PAGE_POINTS[0]} 0 0 {PAGE_POINTS[1]} 0 0 cm /Im0 Do Q".encode("ascii")
+        yield emit(image, (
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray "
+            f"/BitsPerComponent 8 /Filter /FlateDecode /Length {len(pixels)} >>\nstream\n"
+        ).encode("ascii") + pixels + b"\nendstream")
+        yield emit(content, f"<< /Length {len(drawing)} >>\nstream\n".encode("ascii") + drawing + b"\nendstream")
+        yield emit(page, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_POINTS[0]} {PAGE_POINTS[1]}] "
+            f"/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>"
+        ).encode("ascii"))
+
+    references = " ".join(f"{kid} 0 R" for kid in kids)
+    yield emit(2, f"<< /Type /Pages /Kids [{references}] /Count {len(kids)} >>".encode("ascii"))
+
+    xref = [f"xref\n0 {number}\n", "0000000000 65535 f \n"]
+    xref += [f"{offsets[i]:010d} 00000 n \n" for i in range(1, number)]
+    xref.append(f"trailer\n<< /Size {number} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n")
+    yield "".join(xref).encode("ascii")
+
+
+def label_sheet_pdf(labels, pool=None):
+    """Label sheet PDF as a byte stream; pages render in parallel and are sent in order as they finish."""
+    pool = pool or executor()
+    return stream_pdf(pool.map(render_pdf_page, pages(labels)))
@@ -0,0 +1,10 @@
+import re
+
+# Special IDs are a type code followed by a running number, e.g. LAW12.
+LIB_ID = re.compile(r"^([A-Za-z]*)(\d+)$")
+
+
+def lib_id_key(lib_id):
+    """(type code, number) of a special ID, so that LAW9 sorts before LAW10; anything else sorts as (text, 0)."""
+    match = LIB_ID.match(lib_id or "")
+    return (match.group(1).upper(), int(match.group(2))) if match else (lib_id or "", 0)
@@ -0,0 +1,72 @@
+import copy
+import hashlib
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
+
+from . import routers
+from .caching import bump, generation
+
+# Bumped after every committed write to the catalogue or its lookup tables, which retires all cached pages.
+GENERATION_KEY = "artax:catalogue:generation"
+TIMEOUT = 60 * 60 * 24
+TEMPLATE = "artax/book-table.html"
+# Book permissions a listing may depend on; users holding the same ones share cached tables.
+PERMISSIONS = ("artax.view_book", "artax.change_book", "artax.delete_book")
+
+
+def invalidate():
+    bump(GENERATION_KEY)
+
+
+def permission_variant(user):
+    return "".join("1" if user.has_perm(permission) else "0" for permission in PERMISSIONS)
+
+
+def cache_key(kind, params, *parts):
+    query = urlencode(sorted((name, value) for name, value in params.items() if value not in (None, "")))
+    digest = hashlib.sha256(query.encode("utf-8")).hexdigest()[:32]
+    return ":".join(("artax", kind, str(generation(GENERATION_KEY)), *parts, digest))
+
+
+def _without_rows(page):
+    cached = copy.copy(page)
+    cached.object_list = [book.pk for book in page]
+    return cached
+
+
+def page(kind, params, books, build):
+    """
+    One page of a listing. Its ids and cursors are cached, so a repeat costs a primary-key lookup through
+    ``books``; on a miss ``build()`` runs the listing query itself.
+    """
+    key = cache_key(f"{kind}-ids", params)
+    cached = cache.get(key)
+    if cached is None:
+        with routers.filling_cache():
+            result = build()
+        cache.set(key, _without_rows(result), TIMEOUT)
+        return result
+    found = books.in_bulk(cached.object_list)
+    result = copy.copy(cached)
+    result.object_list = [found[pk] for pk in cached.object_list if pk in found]
+    return result
+
+
+def table(request, kind, params, books, build):
+    """
+    (rendered book table, page) of one listing page, where ``params`` are the normalized parameters that
+    decide its rows. The HTML is cached per permission variant; on a hit nothing is queried, and the page
+    comes back with ids in place of books, which is all the pagination links need.
+    """
+    key = cache_key(f"{kind}-table", params, permission_variant(request.user))
+    cached = cache.get(key)
+    if cached is None:
+        with routers.filling_cache():
+            result = page(kind, params, books, build)
+            cached = (render_to_string(TEMPLATE, {"page_obj": result}, request), _without_rows(result))
+        cache.set(key, cached, TIMEOUT)
+    html, result = cached
+    return mark_safe(html), result
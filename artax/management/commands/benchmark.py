@@ -0,0 +1,50 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from artax import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Measures latency, query count and peak memory of the hot views and saves them as JSON, '
+            'optionally compared with an earlier run')
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Benchmarks to run; all of them by default')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request')
+        parser.add_argument('--output', help='JSON file to write; benchmarks/<commit>.json by default')
+        parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+
+    def handle(self, *args, **options):
+        before = benchmark.load(options['compare']) if options['compare'] else None
+        results = benchmark.run(options['names'], options['iterations'], options['warmup'], options['cold'])
+        if not results['results']:
+            raise CommandError('Nothing to benchmark; generate a catalogue first (manage.py generate_catalogue).')
+
+        self.stdout.write(f"{results['books']} books on {results['database']}, commit {results['commit']}"
+                          f"{' (with local changes)' if results['dirty'] else ''}.")
+        self.stdout.write(f"{'benchmark':<26}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'peak KiB':>11}  status")
+        for name, result in results['results'].items():
+            latency = result['latency_ms']
+            self.stdout.write(f"{name:<26}{latency['p50']:>10.2f}{latency['p95']:>10.2f}{result['queries']:>9}"
+                              f"{result['peak_memory_kib']:>11.1f}  {','.join(map(str, result['status']))}")
+
+        output = options['output']
+        if not output:
+            directory = os.path.join(settings.BASE_DIR, 'benchmarks')
+            os.makedirs(directory, exist_ok=True)
+            output = os.path.join(directory, f"{results['commit'] or 'results'}{'-dirty' if results['dirty'] else ''}.json")
+        benchmark.save(results, output)
+        self.stdout.write(self.style.SUCCESS(f'Saved to {output}.'))
+
+        if before:
+            self.stdout.write(f"\nCompared with {options['compare']} (commit {before.get('commit')}):")
+            for name, p50_before, p50_after, change, queries_before, queries_after, peak_before, peak_after \
+                    in benchmark.compare(before, results):
+                style = self.style.ERROR if change > 10 else self.style.SUCCESS if change < -10 else str
+                self.stdout.write(style(
+                    f"{name:<26}{p50_before:>9.2f} -> {p50_after:<9.2f}{change:>+7.1f}%"
+                    f"  queries {queries_before} -> {queries_after}  peak KiB {peak_before} -> {peak_after}"))
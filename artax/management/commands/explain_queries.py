@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from artax import explain
+from artax.models import Book
+
+
+class Command(BaseCommand):
+    help = "Prints the database's EXPLAIN plans for the app's book queries, to check which indexes they use"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true',
+                            help='Run the queries and show actual row counts and timings (PostgreSQL, MySQL)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{Book.objects.count()} books on {connection.vendor}.')
+        found = False
+        for description, plan in explain.plans(options['analyze']):
+            found = True
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{description}'))
+            self.stdout.write(plan)
+        if not found:
+            self.stdout.write('There are no books to build the queries from.')
@@ -0,0 +1,27 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from artax import export, search
+from artax.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Exports the book catalogue, or the books matching a query, as CSV, JSONL or XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=export.FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write; standard output by default')
+        for name in (*search.QUERY_TERMS, *search.QUERY_FILTERS):
+            parser.add_argument(f'--{name}', help=f'Same as the {name} field of the book query form')
+
+    def handle(self, *args, **options):
+        params = {name: options[name] for name in (*search.QUERY_TERMS, *search.QUERY_FILTERS)}
+        books, _ = search.query_books(Book.objects.all(), params)
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in export.export(books, options['format']):
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,39 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from artax import processes, summaries
+from artax.models import Book, BookSummaryText
+
+
+class Command(BaseCommand):
+    help = 'Extracts the text of PDF summaries into the search index, in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--force', action='store_true', help='Re-extract summaries that are already indexed')
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(summary="").exclude(summary=None).values_list('pk', 'summary')
+        done = {} if options['force'] else dict(BookSummaryText.objects.values_list('book_id', 'summary_name'))
+        pending = [(pk, name) for pk, name in books.iterator() if done.get(pk) != name]
+
+        extracted = failed = 0
+        # Workers start without Django; it is set up in each so that artax.summaries can be imported there.
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=processes.context(),
+                                 initializer=django.setup) as pool:
+            futures = {pool.submit(summaries.extract_text, default_storage.path(name)): (pk, name)
+                       for pk, name in pending}
+            for future in as_completed(futures):
+                pk, name = futures[future]
+                try:
+                    summaries.store(pk, name, future.result())
+                    extracted += 1
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+
+        self.stdout.write(self.style.SUCCESS(f'Extracted {extracted} summaries ({failed} failed).'))
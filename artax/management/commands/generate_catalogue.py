@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from artax import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Fills the catalogue with reproducible synthetic books, authors and locations for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=100000)
+        parser.add_argument('--authors', type=int, default=5000)
+        parser.add_argument('--locations', type=int, default=400)
+        parser.add_argument('--seed', type=int, default=0, help='The same seed generates the same catalogue')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        importer = benchmark.generate(options['books'], options['authors'], options['locations'], options['seed'],
+                                      options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {importer.imported} books in {time.perf_counter() - start:.1f}s.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from artax import covers
+from artax.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Generates the WebP renditions of book covers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that already exist')
+
+    def handle(self, *args, **options):
+        generated = 0
+        for name in Book.objects.exclude(cover="").exclude(cover=None).values_list('cover', flat=True).iterator():
+            if options['force'] or not covers.variants(name):
+                try:
+                    covers.generate(name)
+                    generated += 1
+                except (OSError, ValueError) as error:
+                    self.stderr.write(f'{name}: {error}')
+        self.stdout.write(self.style.SUCCESS(f'Generated renditions for {generated} covers.'))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from artax import bulk_import
+from artax.models import User
+
+
+class Command(BaseCommand):
+    help = 'Imports books from a CSV, JSONL or XLSX file in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help=f"File with a header row naming columns among: {', '.join(bulk_import.COLUMNS)}")
+        parser.add_argument('--format', choices=bulk_import.FORMATS,
+                            help='Input format; guessed from the file extension by default')
+        parser.add_argument('--user', help='Username recorded as registrator and last editor')
+        parser.add_argument('--chunk-size', type=int, default=bulk_import.CHUNK_SIZE,
+                            help='Books written per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without writing anything')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or bulk_import.detect_format(options['path'])
+        if file_format not in bulk_import.FORMATS:
+            raise CommandError(f"Can't tell the format of {options['path']}; pass --format.")
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user {options['user']}.")
+
+        importer = bulk_import.BookImporter(user, options['chunk_size'], options['dry_run'])
+        try:
+            importer.run(bulk_import.read_rows(options['path'], file_format))
+        except (OSError, ValueError, DatabaseError) as error:
+            raise CommandError(f'Import stopped after {importer.imported} books: {error}')
+
+        for number, error in importer.errors:
+            self.stderr.write(f'Row {number}: {error}')
+        verb = 'Would import' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {importer.imported} books; {importer.duplicates} duplicate titles skipped, '
+            f'{len(importer.errors)} rows rejected.'))
@@ -0,0 +1,47 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from artax import labels, processes
+from artax.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Renders printable QR label sheets for a run of books'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='lib_from', help='First special ID of the run, e.g. LAW1')
+        parser.add_argument('--to', dest='lib_to', help='Last special ID of the run, e.g. LAW250')
+        parser.add_argument('--location', help='Location code')
+        parser.add_argument('--type', dest='book_type', help='Type code')
+        parser.add_argument('--host', default=settings.ALLOWED_HOSTS[0], help='Host the QR codes point to')
+        parser.add_argument('--format', choices=['pdf', 'png'], default='pdf')
+        parser.add_argument('--output', default='labels', help='PDF file, or directory for PNG pages')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        criteria = {key: options[key] for key in ('lib_from', 'lib_to', 'location', 'book_type')}
+        if not any(criteria.values()):
+            raise CommandError('Give at least one of --from, --to, --location or --type.')
+        books = labels.select_books(Book.objects.all(), **criteria)
+        if not books:
+            raise CommandError('No books match.')
+        sheet = labels.labels_for(books, options['host'])
+
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=processes.context()) as pool:
+            if options['format'] == 'pdf':
+                output = options['output'] if options['output'].endswith('.pdf') else f"{options['output']}.pdf"
+                with open(output, 'wb') as file:
+                    for chunk in labels.label_sheet_pdf(sheet, pool):
+                        file.write(chunk)
+            else:
+                output = options['output']
+                os.makedirs(output, exist_ok=True)
+                for number, page in enumerate(pool.map(labels.render_png_page, labels.pages(sheet)), start=1):
+                    with open(os.path.join(output, f"sheet-{number:03d}.png"), 'wb') as file:
+                        file.write(page)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(books)} labels on {len(labels.pages(sheet))} sheets written to {output}.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from artax import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of the book catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            search.rebuild_index(using=options['database'])
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
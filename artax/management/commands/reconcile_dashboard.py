@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from artax import dashboard
+
+
+class Command(BaseCommand):
+    help = 'Recounts the dashboard figures from the catalogue, e.g. nightly from cron'
+
+    def handle(self, *args, **options):
+        drifted = dashboard.reconcile()
+        self.stdout.write(self.style.SUCCESS(f'Dashboard figures recounted; {drifted} had drifted.'))
@@ -0,0 +1,128 @@
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+from . import metrics
+
+# "nginx" answers with X-Accel-Redirect into MEDIA_ACCEL_REDIRECT_PREFIX (an `internal` location aliased to
+# MEDIA_ROOT), "apache" with X-Sendfile (mod_xsendfile). Anything else streams the file from Python.
+MEDIA_SENDFILE_BACKEND = getattr(settings, "MEDIA_SENDFILE_BACKEND", None)
+MEDIA_ACCEL_REDIRECT_PREFIX = getattr(settings, "MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+
+CHUNK_SIZE = 64 * 1024
+BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _byte_range(header, size):
+    """(start, end) for a single satisfiable ``Range`` header, None to send everything, or False if unsatisfiable."""
+    match = BYTE_RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        length = int(last)
+        return (max(size - length, 0), size - 1) if length and size else False
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, "rb") as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and since >= last_modified
+
+
+def serve(request, path):
+    """
+    Media files for signed-in users. Django only checks access and validators; the bytes are handed to the
+    front-end server when MEDIA_SENDFILE_BACKEND is set, or streamed here with Range support otherwise.
+    """
+    path = posixpath.normpath(path).lstrip("/")
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (OSError, ValueError):
+        raise Http404("Media file not found.")
+    if not os.path.isfile(full_path):
+        raise Http404("Media file not found.")
+
+    etag = _etag(stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _send(request, path, full_path, stat, etag, last_modified)
+    response.headers.setdefault("ETag", etag)
+    response.headers.setdefault("Last-Modified", http_date(last_modified))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _send(request, path, full_path, stat, etag, last_modified):
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or "application/octet-stream"
+
+    if MEDIA_SENDFILE_BACKEND == "nginx":
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = MEDIA_ACCEL_REDIRECT_PREFIX + quote(path)
+        metrics.MEDIA_BYTES.inc("nginx", amount=stat.st_size)
+        return response
+    if MEDIA_SENDFILE_BACKEND == "apache":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = full_path
+        metrics.MEDIA_BYTES.inc("apache", amount=stat.st_size)
+        return response
+
+    byte_range = _byte_range(request.META.get("HTTP_RANGE"), stat.st_size)
+    if byte_range is not None and not _if_range_matches(request, etag, last_modified):
+        byte_range = None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(full_path, "rb"), content_type=content_type)
+        metrics.MEDIA_BYTES.inc("django", amount=stat.st_size)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(full_path, start, end - start + 1),
+                                         content_type=content_type, status=206)
+        response["Content-Length"] = end - start + 1
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        metrics.MEDIA_BYTES.inc("django", amount=end - start + 1)
+    if encoding:
+        response["Content-Encoding"] = encoding
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,313 @@
+import glob
+import hmac
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+METRICS_ENABLED = getattr(settings, "METRICS_ENABLED", False)
+METRICS_DIR = getattr(settings, "METRICS_DIR", os.path.join(settings.BASE_DIR, "cache", "metrics"))
+# Who may read /metrics besides staff: bearers of the token and the listed addresses.
+METRICS_TOKEN = getattr(settings, "METRICS_TOKEN", None)
+METRICS_ALLOWED_IPS = getattr(settings, "METRICS_ALLOWED_IPS", ())
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# File layout: an 8-byte header holding the number of bytes in use, then one entry per sample, each a
+# 4-byte key length, the key padded to a multiple of 8 and an 8-byte float, so values stay aligned.
+HEADER = struct.Struct("<Q")
+KEY_LENGTH = struct.Struct("<I")
+VALUE = struct.Struct("<d")
+INITIAL_SIZE = 64 * 1024
+
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+ERROR_ACCESS_DENIED = 5
+STILL_ACTIVE = 259
+
+
+def _entries(data, used):
+    """(key, value, offset of the value) of every sample in the first ``used`` bytes of a values file."""
+    position = HEADER.size
+    while position < used:
+        (length,) = KEY_LENGTH.unpack_from(data, position)
+        key = bytes(data[position + KEY_LENGTH.size:position + KEY_LENGTH.size + length]).decode()
+        position += KEY_LENGTH.size + length + (-(KEY_LENGTH.size + length) % 8)
+        yield key, VALUE.unpack_from(data, position)[0], position
+        position += VALUE.size
+
+
+class ValuesFile:
+    """
+    The samples of one worker process in a memory-mapped file of its own. Only the owner writes to it, so
+    workers never wait on each other; /metrics reads every worker's file and adds them up. A sample's entry
+    is written in full before the header counts it, so a reader never sees half of one.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "a+b")
+        if os.fstat(self.file.fileno()).st_size < INITIAL_SIZE:
+            self.file.truncate(INITIAL_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.used = HEADER.unpack_from(self.map, 0)[0] or HEADER.size
+        self.offsets = {key: offset for key, _, offset in _entries(self.map, self.used)}
+
+    def add(self, key, amount):
+        offset = self._offset(key)
+        VALUE.pack_into(self.map, offset, VALUE.unpack_from(self.map, offset)[0] + amount)
+
+    def set(self, key, value):
+        VALUE.pack_into(self.map, self._offset(key), value)
+
+    def _offset(self, key):
+        offset = self.offsets.get(key)
+        return self._append(key) if offset is None else offset
+
+    def _append(self, key):
+        encoded = key.encode()
+        padding = -(KEY_LENGTH.size + len(encoded)) % 8
+        size = KEY_LENGTH.size + len(encoded) + padding + VALUE.size
+        if self.used + size > len(self.map):
+            self.map.close()
+            self.file.truncate(max(2 * (self.used + size), INITIAL_SIZE))
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        entry = KEY_LENGTH.pack(len(encoded)) + encoded + b"\0" * padding + VALUE.pack(0.0)
+        self.map[self.used:self.used + size] = entry
+        offset = self.used + size - VALUE.size
+        self.used += size
+        HEADER.pack_into(self.map, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+
+class Registry:
+    """
+    The metrics of the app; values go to this process's file, which is reopened after a fork. A disabled
+    registry ignores values, so instrumented code needs no checks of its own.
+    """
+
+    def __init__(self, directory, enabled=True):
+        self.directory = directory
+        self.enabled = enabled
+        self.metrics = []
+        self.lock = threading.Lock()
+        self.pid = None
+        self.values = None
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def _values(self):
+        # Called with the lock held.
+        if self.pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            self.pid = os.getpid()
+            self.values = ValuesFile(os.path.join(self.directory, f"{self.pid}.db"))
+        return self.values
+
+    def add(self, key, amount):
+        if not self.enabled:
+            return
+        with self.lock:
+            self._values().add(key, amount)
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        with self.lock:
+            self._values().set(key, value)
+
+    def collect(self):
+        """
+        {key: value} summed over the files of all running workers. The file of a worker that has exited is
+        first merged into this worker's own and deleted: its counters and histograms, so counts never go
+        down, but not its gauges, which described the running process. The directory thus holds one file
+        per running worker, however often they are recycled.
+        """
+        gauges = {metric.name for metric in self.metrics if metric.kind == "gauge"}
+        for path in glob.glob(os.path.join(self.directory, "*.db")):
+            pid = int(os.path.splitext(os.path.basename(path))[0])
+            if pid != os.getpid() and not _alive(pid):
+                self._merge(path, gauges)
+
+        totals = defaultdict(float)
+        for path in glob.glob(os.path.join(self.directory, "*.db")):
+            try:
+                with open(path, "rb") as file:
+                    data = file.read()
+            except FileNotFoundError:
+                # Merged by another worker in the meantime.
+                continue
+            if len(data) < HEADER.size:
+                continue
+            for key, value, _ in _entries(data, min(HEADER.unpack_from(data, 0)[0], len(data))):
+                totals[key] += value
+        return totals
+
+    def _merge(self, path, gauges):
+        claimed = f"{path}.merging"
+        try:
+            # Only one of the workers scraping at the same time gets to rename it.
+            os.rename(path, claimed)
+        except OSError:
+            return
+        with open(claimed, "rb") as file:
+            data = file.read()
+        if len(data) >= HEADER.size:
+            with self.lock:
+                values = self._values()
+                for key, value, _ in _entries(data, min(HEADER.unpack_from(data, 0)[0], len(data))):
+                    if value and json.loads(key)[0] not in gauges:
+                        values.add(key, value)
+        os.remove(claimed)
+
+    def exposition(self):
+        """Every metric in the Prometheus text format."""
+        samples = defaultdict(list)
+        for key, value in self.collect().items():
+            name, labels = json.loads(key)
+            samples[name].append((labels, value))
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.lines(samples))
+        return "\n".join(lines) + "\n"
+
+
+def authorized(request):
+    """Whether ``request`` may read the metrics: a staff user, the bearer of METRICS_TOKEN or an allowed address."""
+    if request.user.is_staff or request.META.get("REMOTE_ADDR") in METRICS_ALLOWED_IPS:
+        return True
+    scheme, _, token = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+    return bool(METRICS_TOKEN) and scheme.lower() == "bearer" and hmac.compare_digest(token.encode(),
+                                                                                     METRICS_TOKEN.encode())
+
+
+def _alive(pid):
+    if os.name == "nt":
+        return _alive_on_windows(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # It exists, but belongs to someone else.
+        return True
+    return True
+
+
+def _alive_on_windows(pid):
+    # os.kill would terminate the process there.
+    import ctypes
+
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        return ctypes.get_last_error() == ERROR_ACCESS_DENIED
+    try:
+        code = ctypes.c_ulong()
+        return not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)) or code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += "{" + ",".join(f'{label}="{_escape(text)}"' for label, text in labels) + "}"
+    return f"{name} {float(value)!r}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, documentation, labels=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.keys = {}
+        registry.register(self)
+
+    def _key(self, name, values, **extra):
+        cache_key = (name, values, *extra.items())
+        key = self.keys.get(cache_key)
+        if key is None:
+            key = self.keys[cache_key] = json.dumps([name, [*zip(self.labels, map(str, values)), *extra.items()]])
+        return key
+
+    def inc(self, *values, amount=1):
+        self.registry.add(self._key(self.name, values), amount)
+
+    def lines(self, samples):
+        for labels, value in sorted(samples.get(self.name, ())):
+            yield _sample(self.name, labels, value)
+
+
+class Gauge(Counter):
+    """A value that goes up and down, like open connections; /metrics shows the sum over running workers."""
+
+    kind = "gauge"
+
+    def set(self, value, *values):
+        self.registry.set(self._key(self.name, values), value)
+
+
+class Histogram(Counter):
+    """Observations in buckets; each observation is stored in its own bucket and made cumulative on export."""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labels=(), buckets=()):
+        super().__init__(registry, name, documentation, labels)
+        self.buckets = (*sorted(buckets), math.inf)
+
+    def observe(self, amount, *values):
+        bound = next(bound for bound in self.buckets if amount <= bound)
+        self.registry.add(self._key(f"{self.name}_bucket", values, le=_bound(bound)), 1)
+        self.registry.add(self._key(f"{self.name}_sum", values), amount)
+        self.registry.add(self._key(f"{self.name}_count", values), 1)
+
+    def lines(self, samples):
+        buckets = defaultdict(dict)
+        for labels, value in samples.get(f"{self.name}_bucket", ()):
+            *labels, (_, bound) = labels
+            buckets[tuple(map(tuple, labels))][bound] = value
+        sums = {tuple(map(tuple, labels)): value for labels, value in samples.get(f"{self.name}_sum", ())}
+        counts = {tuple(map(tuple, labels)): value for labels, value in samples.get(f"{self.name}_count", ())}
+        for labels in sorted(counts):
+            cumulative = 0
+            for bound in self.buckets:
+                cumulative += buckets[labels].get(_bound(bound), 0)
+                yield _sample(f"{self.name}_bucket", [*labels, ("le", _bound(bound))], cumulative)
+            yield _sample(f"{self.name}_sum", labels, sums.get(labels, 0))
+            yield _sample(f"{self.name}_count", labels, counts[labels])
+
+
+def _bound(bound):
+    return "+Inf" if bound == math.inf else f"{bound:g}"
+
+
+registry = Registry(METRICS_DIR, METRICS_ENABLED)
+
+REQUESTS = Counter(registry, "artax_requests_total", "Requests by URL name, method and status code.",
+                   ("view", "method", "status"))
+REQUEST_DURATION = Histogram(registry, "artax_request_duration_seconds", "Time to produce a response, by URL name.",
+                             ("view",), buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+DB_QUERIES = Counter(registry, "artax_db_queries_total", "Database queries made while answering requests, by URL name.",
+                     ("view",))
+QR_CACHE = Counter(registry, "artax_qr_cache_lookups_total",
+                   "QR image lookups by where the image was found: memory, disk or rendered anew.", ("result",))
+MEDIA_BYTES = Counter(registry, "artax_media_bytes_served_total",
+                      "Bytes of media files sent, by whether Django or the front-end server sent them.", ("sender",))
+UPLOAD_SIZE = Histogram(registry, "artax_upload_size_bytes", "Sizes of uploaded files, by form field.", ("field",),
+                        buckets=(10_000, 100_000, 1_000_000, 5_000_000, 10_000_000, 25_000_000, 50_000_000))
@@ -0,0 +1,258 @@
+import asyncio
+import cProfile
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.text import slugify
+
+from . import metrics, routers, timing
+
+logger = logging.getLogger(__name__)
+performance_logger = logging.getLogger("performance")
+
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+# As in Django's CSRF check: methods that must not change anything.
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def query_shape(sql):
+    # Parameters are already placeholders; fold IN lists of any length and inlined literals as well.
+    return LITERAL.sub("?", IN_LIST.sub("IN (...)", sql))
+
+
+class QueryShapeRecorder:
+    def __init__(self):
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.shapes[query_shape(sql)] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+def watch_queries(stack, wrapper):
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(wrapper))
+
+
+class RequestWatchingMiddleware:
+    """
+    Base of the middleware below: ``start`` sets up watching the request on an ExitStack, which is closed
+    once the response is ready, and ``finish`` reports. Works in both modes, so it does not force an async
+    view back into a thread. Under ASGI, Django runs a request's ORM calls in a thread of its own, and
+    ``start`` and the closing of the stack run in that thread too, so execute wrappers see its queries.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Like Django's MiddlewareMixin: in async mode, calling the instance returns a coroutine.
+        self._is_coroutine = asyncio.coroutines._is_coroutine if asyncio.iscoroutinefunction(get_response) else None
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        with ExitStack() as stack:
+            state = self.start(request, stack)
+            response = self.get_response(request)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        stack = ExitStack()
+        state = await sync_to_async(self.start)(request, stack)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, state)
+
+    def start(self, request, stack):
+        raise NotImplementedError
+
+    def finish(self, request, response, state):
+        return response
+
+
+class NPlusOneMiddleware(RequestWatchingMiddleware):
+    """
+    Development/test guard that counts same-shape queries within one request and reports (or, with
+    N_PLUS_ONE_RAISE, fails) the request when a shape repeats N_PLUS_ONE_THRESHOLD times or more.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "N_PLUS_ONE_DETECTION", False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.threshold = getattr(settings, "N_PLUS_ONE_THRESHOLD", 5)
+        self.raise_error = getattr(settings, "N_PLUS_ONE_RAISE", False)
+
+    def start(self, request, stack):
+        recorder = QueryShapeRecorder()
+        watch_queries(stack, recorder)
+        return recorder
+
+    def finish(self, request, response, recorder):
+        repeated = recorder.repeated(self.threshold)
+        if repeated:
+            report = "\n".join(f"  {count}x {shape}" for shape, count in repeated)
+            message = f"Repeated queries on {request.method} {request.path}:\n{report}"
+            if self.raise_error:
+                raise NPlusOneError(message)
+            logger.warning(message)
+        return response
+
+
+class ServerTimingMiddleware(RequestWatchingMiddleware):
+    """
+    Measures where each request spends its time (SQL, template rendering, QR rendering, the whole view),
+    sends it back in a ``Server-Timing`` header for the browser's network panel and logs it as a JSON line.
+    With SERVER_TIMING_PROFILE_RATE, that share of requests also runs under cProfile, and the profile of
+    any that take SERVER_TIMING_PROFILE_THRESHOLD_MS or longer is dumped to SERVER_TIMING_PROFILE_DIR.
+    Under ASGI the profile covers the request's thread, i.e. its ORM calls and template rendering.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "SERVER_TIMING", False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.profile_rate = getattr(settings, "SERVER_TIMING_PROFILE_RATE", 0.0)
+        self.profile_threshold = getattr(settings, "SERVER_TIMING_PROFILE_THRESHOLD_MS", 500) / 1000
+        self.profile_dir = getattr(settings, "SERVER_TIMING_PROFILE_DIR", None)
+        timing.instrument_templates()
+
+    def start(self, request, stack):
+        timings = timing.start()
+        stack.callback(timing.stop)
+        watch_queries(stack, timing.QueryTimer())
+        profiler = None
+        if self.profile_dir and random.random() < self.profile_rate:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            stack.callback(profiler.disable)
+        return timings, profiler, time.perf_counter()
+
+    def finish(self, request, response, state):
+        timings, profiler, began = state
+        elapsed = time.perf_counter() - began
+        response["Server-Timing"] = self.header(timings, elapsed)
+        self.log(request, response, timings, elapsed)
+        if profiler is not None and elapsed >= self.profile_threshold:
+            self.dump(profiler, request, elapsed)
+        return response
+
+    @staticmethod
+    def header(timings, elapsed):
+        metrics = []
+        for name, (seconds, count) in timings.spans.items():
+            metrics.append(f'{name};dur={seconds * 1000:.1f};desc="{count}x"')
+        metrics.append(f"total;dur={elapsed * 1000:.1f}")
+        return ", ".join(metrics)
+
+    @staticmethod
+    def log(request, response, timings, elapsed):
+        figures = {"total_ms": round(elapsed * 1000, 1)}
+        for name, (seconds, count) in timings.spans.items():
+            figures[f"{name}_ms"] = round(seconds * 1000, 1)
+            figures[f"{name}_count"] = count
+        performance_logger.info(
+            "%s %s %s in %.1f ms", request.method, request.path, response.status_code, elapsed * 1000,
+            extra={"event": "request", "timings": figures},
+        )
+
+    def dump(self, profiler, request, elapsed):
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{slugify(request.path) or 'root'}" \
+               f"-{elapsed * 1000:.0f}ms.prof"
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.profile_dir, name))
+        except OSError:
+            logger.exception("Could not save the profile of %s %s", request.method, request.path)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware(RequestWatchingMiddleware):
+    """
+    Counts requests, their latency and database queries per URL name, and the sizes of uploaded files, for
+    the /metrics endpoint (see artax.metrics). Requests that match no URL are counted under "unresolved".
+    """
+
+    def __init__(self, get_response):
+        if not metrics.registry.enabled:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def start(self, request, stack):
+        counter = QueryCounter()
+        watch_queries(stack, counter)
+        return counter, time.perf_counter()
+
+    def finish(self, request, response, state):
+        counter, began = state
+        elapsed = time.perf_counter() - began
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unresolved"
+        metrics.REQUESTS.inc(view, request.method, response.status_code)
+        metrics.REQUEST_DURATION.observe(elapsed, view)
+        if counter.count:
+            metrics.DB_QUERIES.inc(view, amount=counter.count)
+        # Only looks at files the view has already parsed, rather than parsing uploads it turned away.
+        files = getattr(request, "_files", None)
+        if files:
+            for field, uploads in files.lists():
+                for upload in uploads:
+                    metrics.UPLOAD_SIZE.observe(upload.size, field)
+        return response
+
+
+class ReplicaPinningMiddleware(RequestWatchingMiddleware):
+    """
+    Lets artax.routers send a request's reads to the replicas, except for a browser that wrote within the
+    last DB_REPLICA_PIN_SECONDS: a request that writes sets a cookie lasting that long, and while it is
+    there the browser reads from the primary and sees its own changes. POSTs and other unsafe methods read
+    from the primary throughout, as they check what they are about to change. Put it before
+    SessionMiddleware and anything else that writes, so those writes count.
+    """
+
+    def __init__(self, get_response):
+        if not routers.REPLICAS:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def start(self, request, stack):
+        pinned = request.method not in SAFE_METHODS or routers.PIN_COOKIE in request.COOKIES
+        routing = routers.start(pinned)
+        stack.callback(routers.stop)
+        return routing
+
+    def finish(self, request, response, routing):
+        if routing.wrote:
+            response.set_cookie(routers.PIN_COOKIE, "1", max_age=routers.PIN_SECONDS, secure=request.is_secure(),
+                                httponly=True, samesite="Lax")
+        return response
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+# The full-text index as artax.search used it when this migration was written: a weighted tsvector column
+# on PostgreSQL, an FTS5 table keyed by book id on SQLite, nothing elsewhere.
+SQL = {
+    "postgresql": (
+        [
+            "ALTER TABLE artax_book ADD COLUMN IF NOT EXISTS search_vector tsvector",
+            "CREATE INDEX IF NOT EXISTS artax_book_search_vector_gin ON artax_book USING gin (search_vector)",
+        ],
+        [
+            "DROP INDEX IF EXISTS artax_book_search_vector_gin",
+            "ALTER TABLE artax_book DROP COLUMN IF EXISTS search_vector",
+        ],
+    ),
+    "sqlite": (
+        [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS artax_book_fts USING fts5("
+            "title, author, publisher, subject, tokenize = 'unicode61 remove_diacritics 2')",
+        ],
+        [
+            "DROP TABLE IF EXISTS artax_book_fts",
+        ],
+    ),
+}
+
+
+def create_search_index(apps, schema_editor):
+    # Populated by 0016 once every table the index reads from exists.
+    for statement in SQL.get(schema_editor.connection.vendor, ([], []))[0]:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    for statement in SQL.get(schema_editor.connection.vendor, ([], []))[1]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artax", "0013_book_summary"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
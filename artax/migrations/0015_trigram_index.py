@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def create_trigram_index(apps, schema_editor):
+    # Servers without pg_trgm skip the index; artax.suggest then matches in process.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute("CREATE INDEX IF NOT EXISTS artax_book_title_trgm "
+                          "ON artax_book USING gin (title gin_trgm_ops)")
+    schema_editor.execute("CREATE INDEX IF NOT EXISTS artax_author_name_trgm "
+                          "ON artax_author USING gin (name gin_trgm_ops)")
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS artax_book_title_trgm")
+        schema_editor.execute("DROP INDEX IF EXISTS artax_author_name_trgm")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artax", "0014_book_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
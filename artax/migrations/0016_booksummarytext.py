@@ -0,0 +1,58 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Content searches cover the subject and the text extracted from the PDF summary.
+SUBJECT_DOCUMENT = ("coalesce(b.subject, '') || ' ' || coalesce("
+                    "(SELECT s.text FROM artax_booksummarytext AS s WHERE s.book_id = b.id), '')")
+
+# artax.search's full reindex as of this migration.
+REBUILD_SQL = {
+    "postgresql": [
+        "UPDATE artax_book AS b SET search_vector = "
+        "setweight(to_tsvector('simple', coalesce(b.title, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(a.name, '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(b.publisher, '')), 'C') || "
+        f"setweight(to_tsvector('simple', {SUBJECT_DOCUMENT}), 'D') "
+        "FROM artax_author AS a WHERE a.id = b.author_id",
+    ],
+    "sqlite": [
+        "DELETE FROM artax_book_fts",
+        "INSERT INTO artax_book_fts (rowid, title, author, publisher, subject) "
+        f"SELECT b.id, b.title, a.name, b.publisher, {SUBJECT_DOCUMENT} "
+        "FROM artax_book AS b JOIN artax_author AS a ON a.id = b.author_id",
+    ],
+}
+
+
+def rebuild_search_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for statement in REBUILD_SQL.get(schema_editor.connection.vendor, []):
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artax", "0015_trigram_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookSummaryText",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="summary_text",
+                        serialize=False,
+                        to="artax.book",
+                    ),
+                ),
+                ("summary_name", models.CharField(max_length=250)),
+                ("text", models.TextField(blank=True)),
+                ("extracted_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+import re
+
+from django.db import migrations, models
+
+# artax.lib_ids.LIB_ID as of this migration.
+LIB_ID = re.compile(r"^([A-Za-z]*)(\d+)$")
+
+
+def backfill_counters(apps, schema_editor):
+    # Each type code's counter starts after the highest special ID already carrying the code, whatever the
+    # type of that book.
+    Type = apps.get_model("artax", "Type")
+    Book = apps.get_model("artax", "Book")
+    LibIdCounter = apps.get_model("artax", "LibIdCounter")
+    highest = {code.strip().upper(): 0 for code in Type.objects.values_list("code", flat=True)}
+    for lib_id in Book.objects.values_list("lib_id", flat=True).iterator(chunk_size=10000):
+        match = LIB_ID.match(lib_id or "")
+        if match and match.group(1).upper() in highest:
+            code = match.group(1).upper()
+            highest[code] = max(highest[code], int(match.group(2)))
+    LibIdCounter.objects.bulk_create(
+        [LibIdCounter(code=code, last_number=number) for code, number in highest.items()])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artax", "0016_booksummarytext"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LibIdCounter",
+            fields=[
+                ("code", models.CharField(max_length=3, primary_key=True, serialize=False)),
+                ("last_number", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artax", "0017_libidcounter"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookRevision",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("edited_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("changes", models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="revisions",
+                        to="artax.book",
+                    ),
+                ),
+                (
+                    "editor",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="book_revisions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["book", "-id"], name="artax_revision_book_idx"),
+                    models.Index(fields=["editor", "-edited_at"], name="artax_revision_editor_idx"),
+                    models.Index(fields=["edited_at"], name="artax_revision_time_idx"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+# Book columns each dashboard breakdown is counted by, as artax.dashboard had them for this migration.
+DIMENSIONS = {
+    "type": "type_id",
+    "location": "location_id",
+    "language": "language_id",
+    "registrator": "registrator_id",
+    "month": "date_of_registration",
+}
+
+
+def count_catalogue(apps, schema_editor):
+    # The whole catalogue under ("total", ""), and each breakdown keyed by id, or by "YYYY-MM" for months.
+    Book = apps.get_model("artax", "Book")
+    CatalogueStat = apps.get_model("artax", "CatalogueStat")
+    books = Book.objects.order_by()
+    totals = books.aggregate(books=Count("pk"), copies=Sum("number_of_copies"))
+    stats = [CatalogueStat(dimension="total", key="", books=totals["books"], copies=totals["copies"] or 0)]
+    for dimension, name in DIMENSIONS.items():
+        grouped = books.annotate(value=TruncMonth(name) if dimension == "month" else F(name))
+        for row in grouped.values("value").annotate(books=Count("pk"), copies=Sum("number_of_copies")):
+            value = row["value"]
+            if value is None:
+                key = ""
+            elif dimension == "month":
+                key = f"{value.year:04d}-{value.month:02d}"
+            else:
+                key = str(value)
+            stats.append(CatalogueStat(dimension=dimension, key=key, books=row["books"], copies=row["copies"] or 0))
+    CatalogueStat.objects.bulk_create(stats)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artax", "0018_bookrevision"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogueStat",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("dimension", models.CharField(max_length=20)),
+                ("key", models.CharField(blank=True, max_length=50)),
+                ("books", models.IntegerField(default=0)),
+                ("copies", models.IntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("dimension", "key"), name="artax_cataloguestat_unique"),
+                ],
+            },
+        ),
+        migrations.RunPython(count_catalogue, migrations.RunPython.noop),
+    ]
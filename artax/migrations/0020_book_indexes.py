@@ -0,0 +1,38 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_lib_ids(apps, schema_editor):
+    # Which of two books keeps a printed special ID is for a person to decide, so stop rather than renumber.
+    Book = apps.get_model("artax", "Book")
+    duplicated = (Book.objects.values("lib_id").annotate(books=Count("id")).filter(books__gt=1)
+                  .values_list("lib_id", flat=True))
+    shared = {}
+    for pk, lib_id in Book.objects.filter(lib_id__in=duplicated).order_by("lib_id", "pk").values_list("pk", "lib_id"):
+        shared.setdefault(lib_id, []).append(str(pk))
+    if shared:
+        listed = "; ".join(f"{lib_id}: books {', '.join(pks)}" for lib_id, pks in shared.items())
+        raise RuntimeError(f"Special IDs used by more than one book ({listed}). Give each book its own special ID "
+                           f"and run the migration again.")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artax", "0019_cataloguestat"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_lib_ids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="book",
+            constraint=models.UniqueConstraint(fields=("lib_id",), name="artax_book_lib_id_unique"),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(fields=["title"], name="artax_book_title_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(condition=models.Q(("isbn__isnull", False)), fields=["isbn"], name="artax_book_isbn_idx"),
+        ),
+    ]
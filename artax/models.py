@@ -1,26 +1,30 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from datetime import datetime
 from phonenumber_field.modelfields import PhoneNumberField
 from django.core.validators import EmailValidator
 import os
+import uuid
+from . import covers
+
+
+def upload_stem(instance):
+    # Files are named after the book; one uploaded before the book has a pk gets a unique stand-in instead
+    # of a guess at the next pk (new_book saves the book first, so that only happens outside the views).
+    return instance.id if instance.id is not None else f"new-{uuid.uuid4().hex}"
 
 
 def custom_summary_filename(instance, filename):
     _, file_extension = os.path.splitext(filename)
-    book_id = Book.objects.all().last().pk
-    if book_id is None:
-        book_id = 0
-    filename = f"{instance.id if instance.id is not None else book_id + 1}-summary{file_extension}"
+    filename = f"{upload_stem(instance)}-summary{file_extension}"
     return f"summaries/{filename}"
 
 
 def custom_cover_filename(instance, filename):
     _, file_extension = os.path.splitext(filename)
-    book_id = Book.objects.all().last().pk
-    if book_id is None:
-        book_id = 0
-    filename = f"{instance.id if instance.id is not None else book_id + 1}-cover{file_extension}"
+    filename = f"{upload_stem(instance)}-cover{file_extension}"
     return f"cover/{filename}"
 
 
@@ -40,6 +44,18 @@ class User(AbstractUser):
         return f"{self.first_name} {self.last_name}".strip()
 
 
+class BookQuerySet(models.QuerySet):
+    def for_listing(self):
+        # Exactly what the book tables render, joined in one query.
+        return self.select_related("author", "type", "location").only(
+            "id", "lib_id", "title", "section", "number_of_copies", "publishing_date",
+            "author__name", "type__name", "location__code",
+        )
+
+    def for_detail(self):
+        return self.select_related("author", "type", "location", "language", "registrator", "last_editor")
+
+
 class Book(models.Model):
     lib_id = models.CharField(max_length=50, default="ABC123")
     author = models.ForeignKey("Author", models.PROTECT, related_name="book")
@@ -61,9 +77,67 @@ class Book(models.Model):
     last_editor = models.ForeignKey(User, models.SET_NULL, null=True, related_name="book_latest_editor")
     last_edit_time = models.DateTimeField()
 
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Special IDs are printed on the labels and looked up from them, so one may only name one book.
+            models.UniqueConstraint(fields=["lib_id"], name="artax_book_lib_id_unique"),
+        ]
+        indexes = [
+            # new_book's duplicate title check.
+            models.Index(fields=["title"], name="artax_book_title_idx"),
+            # Most books have no ISBN; only the ones that do are worth indexing.
+            models.Index(fields=["isbn"], name="artax_book_isbn_idx", condition=models.Q(isbn__isnull=False)),
+        ]
+
     def __str__(self):
         return f"{self.title} by {self.author}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        book = super().from_db(db, field_names, values)
+        # The columns as stored, so that the dashboard can tell what a save changes (dashboard.before_save).
+        book._loaded_values = dict(zip(field_names, values))
+        # The summary as stored, so that a save can tell whether it was removed (signals.extract_summary_text).
+        if "summary" in book.__dict__:
+            book._stored_summary = book.__dict__["summary"] or ""
+        return book
+
+    def cover_variants(self):
+        return covers.variants(self.cover.name) if self.cover else []
+
+    def cover_srcset(self):
+        return ", ".join(f"{url} {width}w" for url, width in self.cover_variants())
+
+
+class BookSummaryText(models.Model):
+    book = models.OneToOneField(Book, models.CASCADE, primary_key=True, related_name="summary_text")
+    summary_name = models.CharField(max_length=250)
+    text = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Summary text of book {self.book_id}"
+
+
+class BookRevision(models.Model):
+    """One edit of a book: only the fields that changed, as {field: [old, new]}. Rows are never updated."""
+    book = models.ForeignKey(Book, models.CASCADE, related_name="revisions")
+    editor = models.ForeignKey(User, models.SET_NULL, null=True, related_name="book_revisions")
+    edited_at = models.DateTimeField(default=timezone.now)
+    changes = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["book", "-id"], name="artax_revision_book_idx"),
+            models.Index(fields=["editor", "-edited_at"], name="artax_revision_editor_idx"),
+            models.Index(fields=["edited_at"], name="artax_revision_time_idx"),
+        ]
+
+    def __str__(self):
+        return f"Revision {self.pk} of book {self.book_id}"
+
 
 class File(models.Model):
     client = models.ForeignKey("Client", models.PROTECT)
@@ -107,6 +181,37 @@ class Location(models.Model):
         return f"{self.code}"
 
 
+class LibIdCounter(models.Model):
+    """
+    Last number handed out in the ``<code><n>`` special IDs of a type code, upper-cased: special IDs must
+    be unique, and type codes need not be.
+    """
+    code = models.CharField(max_length=3, primary_key=True)
+    last_number = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.code}{self.last_number}"
+
+
+class CatalogueStat(models.Model):
+    """
+    Running count of books and copies for one dashboard figure: the whole catalogue (``total``), or one
+    type, location, language, registrator or registration month. Kept current by the Book signals.
+    """
+    dimension = models.CharField(max_length=20)
+    key = models.CharField(max_length=50, blank=True)
+    books = models.IntegerField(default=0)
+    copies = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["dimension", "key"], name="artax_cataloguestat_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension} {self.key}: {self.books} books, {self.copies} copies"
+
+
 class Language(models.Model):
     name = models.CharField(max_length=250)
     code = models.CharField(max_length=3)
@@ -0,0 +1,54 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .lib_ids import lib_id_key
+from .models import Book, LibIdCounter
+
+
+def counter_code(code):
+    # Types may share a code ("LAW" and "law" give IDs that lib_id_key reads alike), so they share a counter.
+    return (code or "").strip().upper()
+
+
+def _highest(code):
+    """Highest number among the special IDs in use for ``code``, whatever the type of their books."""
+    lib_ids = Book.objects.filter(lib_id__istartswith=code).values_list("lib_id", flat=True)
+    return max((number for prefix, number in map(lib_id_key, lib_ids) if prefix == code), default=0)
+
+
+def _counter(code):
+    # Created on first use for codes added after the backfill, starting after any special IDs already
+    # carrying the code; a concurrent creator wins the race harmlessly.
+    if not LibIdCounter.objects.filter(code=code).exists():
+        try:
+            with transaction.atomic():
+                LibIdCounter.objects.create(code=code, last_number=_highest(code))
+        except IntegrityError:
+            pass
+    return LibIdCounter.objects.filter(code=code)
+
+
+def allocate(code, count=1):
+    """
+    Reserves ``count`` consecutive numbers for the special IDs of a type code and returns the first. The
+    UPDATE locks the counter row until the caller's transaction ends, so concurrent inserts never share a
+    number, and a rolled-back insert gives its numbers back.
+    """
+    with transaction.atomic():
+        counter = _counter(counter_code(code))
+        counter.update(last_number=F("last_number") + count)
+        return counter.values_list("last_number", flat=True).get() - count + 1
+
+
+def next_lib_id(book_type):
+    # Numbers already taken by hand-entered or legacy special IDs are skipped, not handed out again.
+    while True:
+        lib_id = f"{book_type.code}{allocate(book_type.code)}"
+        if not Book.objects.filter(lib_id=lib_id).exists():
+            return lib_id
+
+
+def advance(code, number):
+    """Makes sure numbers up to ``number`` are never handed out, e.g. after importing explicit special IDs."""
+    _counter(counter_code(code)).update(last_number=Greatest(F("last_number"), number))
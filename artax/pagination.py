@@ -0,0 +1,78 @@
+import json
+
+from django.db.models import Q
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+NEXT = "n"
+PREVIOUS = "p"
+
+
+def encode_cursor(direction, values):
+    return urlsafe_base64_encode(json.dumps([direction, values]).encode("utf-8"))
+
+
+def decode_cursor(cursor, keys):
+    if not cursor:
+        return NEXT, None
+    try:
+        direction, values = json.loads(urlsafe_base64_decode(cursor).decode("utf-8"))
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return NEXT, None
+    if direction not in (NEXT, PREVIOUS):
+        return NEXT, None
+    if values is not None and not (isinstance(values, list) and len(values) == len(keys) and all(
+            isinstance(value, (int, float)) and not isinstance(value, bool) for value in values)):
+        return NEXT, None
+    return direction, values
+
+
+def seek_filter(keys, values, lookup):
+    # Row-value comparison (k1, k2, ...) > (v1, v2, ...) spelled out so every backend can use the index.
+    condition = Q()
+    for i, key in enumerate(keys):
+        condition |= Q(**{k: v for k, v in zip(keys[:i], values[:i])}, **{f"{key}__{lookup}": values[i]})
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, object_list, keys, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next and bool(object_list)
+        self.has_previous = has_previous and bool(object_list)
+        self.next_cursor = encode_cursor(NEXT, self._values(object_list[-1], keys)) if self.has_next else None
+        self.previous_cursor = encode_cursor(PREVIOUS, self._values(object_list[0], keys)) if self.has_previous else None
+        self.last_cursor = encode_cursor(PREVIOUS, None)
+
+    @staticmethod
+    def _values(row, keys):
+        return [getattr(row, key) for key in keys]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def keyset_page(queryset, cursor, per_page, descending=False, keys=("pk",)):
+    """
+    Seek pagination on ``keys`` (the last one must be unique): every page is a single indexed
+    range scan of per_page + 1 rows, so deep pages and descending order cost the same as the first page.
+    """
+    direction, values = decode_cursor(cursor, keys)
+    forward = direction == NEXT
+    # Walking backwards means scanning against the display order and flipping the rows afterwards.
+    scan_descending = descending == forward
+    if values is not None:
+        queryset = queryset.filter(seek_filter(keys, values, "lt" if scan_descending else "gt"))
+    rows = list(queryset.order_by(*[f"-{key}" if scan_descending else key for key in keys])[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if forward:
+        return KeysetPage(rows, keys, has_next=has_more, has_previous=values is not None)
+    rows.reverse()
+    return KeysetPage(rows, keys, has_next=values is not None, has_previous=has_more)
@@ -0,0 +1,11 @@
+import multiprocessing
+
+
+def context():
+    """
+    Multiprocessing context for process pools. Web workers and management commands already run threads
+    (the audit log listener, the cover and summary pools), and a child forked while one of them holds a
+    lock could deadlock on it, so children start from a fork server, or fresh where there is none.
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
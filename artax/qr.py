@@ -0,0 +1,161 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+
+from . import metrics, timing
+
+QR_OPTIONS = {
+    "version": 2,
+    "error_correction": qrcode.constants.ERROR_CORRECT_L,
+    "box_size": 8,
+    "border": 4,
+}
+
+FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+QR_CACHE_DIR = getattr(settings, "QR_CACHE_DIR", os.path.join(settings.BASE_DIR, "cache", "qr"))
+QR_MEMORY_ENTRIES = getattr(settings, "QR_MEMORY_ENTRIES", 512)
+# Most images kept on disk; past it, the least recently used are deleted down to 90% of it.
+QR_DISK_ENTRIES = getattr(settings, "QR_DISK_ENTRIES", 20000)
+
+
+def cache_key(payload, image_format):
+    """Content address of a QR image: the same payload and render options always give the same bytes."""
+    options = json.dumps([payload, image_format, QR_OPTIONS], sort_keys=True)
+    return hashlib.sha256(options.encode("utf-8")).hexdigest()
+
+
+def render(payload, image_format):
+    qr = qrcode.QRCode(**QR_OPTIONS)
+    qr.add_data(payload)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    if image_format == "svg":
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class QRCodeCache:
+    """
+    Two-level cache of rendered QR images: a per-process LRU in front of a shared directory on disk. A file's
+    modification time is its last use, so the disk level can be pruned least recently used first.
+    """
+
+    def __init__(self, directory, max_entries, max_files):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Files on disk as far as this process knows: counted on its first store, then kept up to date.
+        self.files = None
+        self.disk_lock = threading.Lock()
+
+    def _remember(self, key, content):
+        with self.lock:
+            self.entries[key] = content
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _path(self, key, image_format):
+        return os.path.join(self.directory, key[:2], f"{key}.{image_format}")
+
+    def recall(self, key):
+        """The image under ``key`` if this process has it in memory; never touches the disk."""
+        with self.lock:
+            content = self.entries.get(key)
+            if content is not None:
+                self.entries.move_to_end(key)
+        if content is not None:
+            metrics.QR_CACHE.inc("memory")
+        return content
+
+    def get(self, payload, image_format):
+        key = cache_key(payload, image_format)
+        content = self.recall(key)
+        if content is not None:
+            return key, content
+
+        path = self._path(key, image_format)
+        try:
+            with open(path, "rb") as file:
+                content = file.read()
+            metrics.QR_CACHE.inc("disk")
+            self._touch(path)
+        except FileNotFoundError:
+            metrics.QR_CACHE.inc("rendered")
+            with timing.span("qr"):
+                content = render(payload, image_format)
+            self._store(path, content)
+        self._remember(key, content)
+        return key, content
+
+    def _store(self, path, content):
+        # Write-then-rename so concurrent workers never read a half-written image.
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(content)
+            os.replace(temporary, path)
+        except OSError:
+            return
+        with self.disk_lock:
+            if self.files is None:
+                self.files = len(self._images())
+            else:
+                self.files += 1
+            if self.files > self.max_files:
+                self.files = self._prune()
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _images(self):
+        """(last use, path) of every image on disk."""
+        images = []
+        try:
+            folders = [entry.path for entry in os.scandir(self.directory) if entry.is_dir()]
+        except OSError:
+            return images
+        for folder in folders:
+            try:
+                with os.scandir(folder) as entries:
+                    images.extend((entry.stat().st_mtime, entry.path) for entry in entries
+                                  if entry.is_file() and not entry.name.endswith(".tmp"))
+            except OSError:
+                pass
+        return images
+
+    def _prune(self):
+        """Deletes the least recently used images down to 90% of ``max_files``; returns how many are left."""
+        images = sorted(self._images())
+        keep = self.max_files * 9 // 10
+        for _, path in images[:max(0, len(images) - keep)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return min(len(images), keep)
+
+
+qr_cache = QRCodeCache(QR_CACHE_DIR, QR_MEMORY_ENTRIES, QR_DISK_ENTRIES)
@@ -0,0 +1,43 @@
+from . import routers
+from .caching import bump, generation
+from .models import Author, Language, Location, Type
+
+GENERATION_KEY = "artax:reference:generation"
+
+# Lookup tables behind the book form dropdowns. They change a few times a year, so every worker keeps
+# them in memory and reloads only when a write somewhere has bumped the shared generation number.
+TABLES = {
+    "types": lambda: Type.objects.all(),
+    "authors": lambda: Author.objects.all(),
+    "locations": lambda: Location.objects.order_by("code"),
+    "languages": lambda: Language.objects.all(),
+}
+
+_tables = {}
+
+
+def get(name, current=None):
+    if current is None:
+        current = generation(GENERATION_KEY)
+    cached = _tables.get(name)
+    if cached is None or cached[0] != current:
+        with routers.filling_cache():
+            cached = (current, tuple(TABLES[name]()))
+        _tables[name] = cached
+    return cached[1]
+
+
+def lookups():
+    """The four dropdown tables as a template context dict; treat the rows as read-only."""
+    # One look at the shared generation for all four, as it costs a cache round trip.
+    current = generation(GENERATION_KEY)
+    return {name: get(name, current) for name in TABLES}
+
+
+def version():
+    """Changes whenever any of the tables does, e.g. as part of a page's ETag."""
+    return generation(GENERATION_KEY)
+
+
+def invalidate():
+    bump(GENERATION_KEY)
@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+
+from django.db import models, transaction
+
+from .models import Book, BookRevision
+
+# Book fields whose edits are kept; bookkeeping like last_editor/last_edit_time is left out.
+TRACKED_FIELDS = (
+    "title", "author", "type", "subject", "section", "location", "publisher", "publishing_date",
+    "purchase_date", "isbn", "number_of_copies", "language", "summary", "cover",
+)
+
+
+def _value(book, name):
+    """(comparable value, value to store) of a field; relations are compared by pk and stored as their label."""
+    field = Book._meta.get_field(name)
+    if field.is_relation:
+        related_id = getattr(book, field.attname)
+        return related_id, str(getattr(book, name)) if related_id is not None else None
+    value = field.value_from_object(book)
+    if isinstance(field, models.FileField):
+        value = value.name
+    else:
+        value = field.to_python(value)
+    # Empty form inputs and NULL columns mean the same thing here.
+    value = None if value == "" else value
+    return value, value
+
+
+def snapshot(book):
+    return {name: _value(book, name) for name in TRACKED_FIELDS}
+
+
+def changes(before, after):
+    return {name: [before[name][1], after[name][1]] for name in TRACKED_FIELDS if before[name][0] != after[name][0]}
+
+
+@contextmanager
+def track(book, editor):
+    """
+    Saves whatever the block changes on ``book`` as a revision by ``editor``, in the same transaction as the
+    block's own writes. Edits that change none of the tracked fields leave no revision.
+    """
+    before = snapshot(book)
+    with transaction.atomic():
+        yield
+        diff = changes(before, snapshot(book))
+        if diff:
+            BookRevision.objects.create(book=book, editor=editor, changes=diff)
+
+
+def changed_since(since):
+    """Revisions made at or after ``since``, newest first, e.g. for "what changed last week"."""
+    return BookRevision.objects.filter(edited_at__gte=since).select_related("book", "editor").order_by("-edited_at")
@@ -0,0 +1,90 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .caching import CHANGED_KEY
+
+# Aliases of DATABASES that replicate the primary ("default") and take its reads.
+REPLICAS = tuple(getattr(settings, "DATABASE_REPLICAS", ()))
+# How far the replicas may lag behind: for this long after it writes, a browser reads from the primary.
+PIN_SECONDS = getattr(settings, "DB_REPLICA_PIN_SECONDS", 10)
+PIN_COOKIE = getattr(settings, "DB_REPLICA_PIN_COOKIE", "artax_primary")
+# Apps always read from the primary: a session read from a lagging replica could sign the user out, and
+# a stale cache entry (DatabaseCache) could hide the generation bump that retires a cached page.
+PRIMARY_APPS = {"sessions", "django_cache"}
+
+_current = ContextVar("artax_routing", default=None)
+_primary = ContextVar("artax_primary_reads", default=False)
+
+
+class Routing:
+    """Where the current request reads: the primary if it was pinned when it came in, or once it has written."""
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def start(pinned):
+    routing = Routing(pinned)
+    _current.set(routing)
+    return routing
+
+
+def stop():
+    # Like timing.stop: under ASGI, start and stop run in different copies of the request's context.
+    _current.set(None)
+
+
+@contextmanager
+def filling_cache():
+    """
+    Reads in the block fill a cache that writes retire by bumping a generation once they commit (see
+    artax.caching). Until the replicas have caught up with the last such write they come from the primary,
+    or rows from before it would be cached under the new generation.
+    """
+    if not REPLICAS or time.time() - cache.get(CHANGED_KEY, 0) >= PIN_SECONDS:
+        yield
+        return
+    token = _primary.set(True)
+    try:
+        yield
+    finally:
+        _primary.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of a request to a random replica and all writes to the primary. Reads go to the primary
+    instead inside a transaction, for the rest of a request that has written, for PIN_SECONDS after a
+    browser's last write (ReplicaPinningMiddleware) and outside of requests, e.g. in management commands.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not REPLICAS or model._meta.app_label in PRIMARY_APPS or _primary.get():
+            return DEFAULT_DB_ALIAS
+        routing = _current.get()
+        if routing is None or routing.pinned or routing.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        routing = _current.get()
+        if routing is not None and model._meta.app_label not in PRIMARY_APPS:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication.
+        return False if db in REPLICAS else None
@@ -0,0 +1,164 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# Searchable document columns, strongest first. On PostgreSQL they map onto the four tsvector
+# weight labels; on SQLite they are the FTS5 columns, weighted the same way by bm25().
+DOCUMENT = ("title", "author", "publisher", "subject")
+PG_WEIGHTS = dict(zip(DOCUMENT, "ABCD"))
+FTS5_WEIGHTS = ", ".join(("10.0", "5.0", "2.0", "1.0"))
+FTS5_TABLE = "artax_book_fts"
+
+FALLBACK_LOOKUPS = {
+    "title": ("title__icontains",),
+    "author": ("author__name__icontains",),
+    "publisher": ("publisher__icontains",),
+    "subject": ("subject__icontains", "summary_text__text__icontains"),
+}
+
+# Content searches cover the subject and the text extracted from the PDF summary.
+SUBJECT_DOCUMENT = ("coalesce(b.subject, '') || ' ' || coalesce("
+                    "(SELECT s.text FROM artax_booksummarytext AS s WHERE s.book_id = b.id), '')")
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN.findall(str(text).lower())
+
+
+def pg_query(terms):
+    # Every token has to prefix-match a word of the column it was typed into.
+    return " & ".join(f"{token}:*{PG_WEIGHTS[column]}"
+                      for column, text in terms.items() for token in tokenize(text))
+
+
+def fts5_query(terms):
+    return " AND ".join(f'{column} : "{token}"*' for column, text in terms.items() for token in tokenize(text))
+
+
+def search_books(queryset, terms):
+    """
+    Filters ``queryset`` down to the books matching ``terms`` (a dict of document column to user text)
+    and annotates each one with a ``rank``, higher meaning more relevant.
+    """
+    terms = {column: text for column, text in terms.items() if tokenize(text)}
+    if not terms:
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+    if connection.vendor == "postgresql":
+        query = pg_query(terms)
+        return queryset.filter(
+            RawSQL("artax_book.search_vector @@ to_tsquery('simple', %s)", [query], output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL("ts_rank(artax_book.search_vector, to_tsquery('simple', %s))::float8", [query],
+                        output_field=FloatField())
+        )
+    if connection.vendor == "sqlite":
+        query = fts5_query(terms)
+        return queryset.filter(
+            RawSQL(f"artax_book.id IN (SELECT rowid FROM {FTS5_TABLE} WHERE {FTS5_TABLE} MATCH %s)", [query],
+                   output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL(f"(SELECT -bm25({FTS5_TABLE}, {FTS5_WEIGHTS}) FROM {FTS5_TABLE} "
+                        f"WHERE {FTS5_TABLE} MATCH %s AND rowid = artax_book.id)", [query],
+                        output_field=FloatField())
+        )
+
+    condition = Q()
+    for column, text in terms.items():
+        matches = Q()
+        for lookup in FALLBACK_LOOKUPS[column]:
+            matches |= Q(**{lookup: text})
+        condition &= matches
+    return queryset.filter(condition).annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+# Parameters of the book query form: dropdown values are exact names/codes, free text goes through the index.
+QUERY_FILTERS = {
+    "type": "type__name",
+    "location": "location__code",
+    "language": "language__code",
+    "author": "author__name",
+}
+QUERY_TERMS = {
+    "title": "title",
+    "content": "subject",
+    "publisher": "publisher",
+}
+
+
+def query_books(queryset, params):
+    """
+    Applies the book query form's parameters (``request.GET`` or any dict) to ``queryset``. Returns the
+    ranked queryset and the search terms, so callers can tell whether there was any free text.
+    """
+    filters = {}
+    for name, lookup in QUERY_FILTERS.items():
+        value = params.get(name)
+        if value is not None and value != "0" and value.strip() != "":
+            filters[lookup] = value
+    terms = {column: params.get(name) or "" for name, column in QUERY_TERMS.items()}
+    if filters:
+        queryset = queryset.filter(**filters)
+    return search_books(queryset, terms), terms
+
+
+def query_params(params):
+    """
+    The query form's parameters reduced to what ``query_books`` acts on, so that requests for the same
+    results compare equal (e.g. as a cache key): unused dropdowns dropped, free text reduced to its tokens.
+    """
+    normalized = {}
+    for name in QUERY_FILTERS:
+        value = params.get(name)
+        if value is not None and value != "0" and value.strip() != "":
+            normalized[name] = value
+    for name in QUERY_TERMS:
+        text = params.get(name) or ""
+        # Without an index the text is matched as typed.
+        normalized[name] = " ".join(tokenize(text)) if connection.vendor in ("postgresql", "sqlite") else text
+    return normalized
+
+
+def _reindex(where, params, using=DEFAULT_DB_ALIAS):
+    with connections[using].cursor() as cursor:
+        if connections[using].vendor == "postgresql":
+            cursor.execute(
+                "UPDATE artax_book AS b SET search_vector = "
+                "setweight(to_tsvector('simple', coalesce(b.title, '')), 'A') || "
+                "setweight(to_tsvector('simple', coalesce(a.name, '')), 'B') || "
+                "setweight(to_tsvector('simple', coalesce(b.publisher, '')), 'C') || "
+                f"setweight(to_tsvector('simple', {SUBJECT_DOCUMENT}), 'D') "
+                f"FROM artax_author AS a WHERE a.id = b.author_id AND {where}", params)
+        elif connections[using].vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {FTS5_TABLE} WHERE rowid IN (SELECT b.id FROM artax_book AS b WHERE {where})",
+                           params)
+            cursor.execute(
+                f"INSERT INTO {FTS5_TABLE} (rowid, {', '.join(DOCUMENT)}) "
+                f"SELECT b.id, b.title, a.name, b.publisher, {SUBJECT_DOCUMENT} "
+                f"FROM artax_book AS b JOIN artax_author AS a ON a.id = b.author_id WHERE {where}", params)
+
+
+def index_book(book_id):
+    _reindex("b.id = %s", [book_id])
+
+
+def index_books_from(book_id):
+    _reindex("b.id >= %s", [book_id])
+
+
+def index_author_books(author_id):
+    _reindex("b.author_id = %s", [author_id])
+
+
+def unindex_book(book_id):
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS5_TABLE} WHERE rowid = %s", [book_id])
+
+
+def rebuild_index(using=DEFAULT_DB_ALIAS):
+    _reindex("1 = 1", [], using=using)
@@ -0,0 +1,118 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import covers, dashboard, listings, reference, search, suggest, summaries
+from .models import Author, Book, Language, Location, Type, User
+
+
+@receiver(post_save, sender=Book)
+def index_saved_book(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_book(instance.pk)
+
+
+@receiver(post_save, sender=Book)
+def generate_cover_variants(sender, instance, raw=False, **kwargs):
+    if not raw and instance.cover and not instance.cover_variants():
+        covers.schedule(instance.cover.name)
+
+
+@receiver(post_save, sender=Book)
+def extract_summary_text(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and "summary" not in update_fields):
+        return
+    stored, instance._stored_summary = getattr(instance, "_stored_summary", None), instance.summary.name or ""
+    if not instance.summary:
+        # Only a book that had a summary has text to clear; one not loaded from the database might have.
+        if not created and stored != "":
+            summaries.clear(instance.pk)
+    elif not summaries.is_current(instance.pk, instance.summary.name):
+        summaries.schedule(instance.pk, instance.summary.name)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_deleted_book(sender, instance, **kwargs):
+    search.unindex_book(instance.pk)
+
+
+@receiver(post_save, sender=Author)
+def reindex_author_books(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw:
+        search.index_author_books(instance.pk)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_suggestions(sender, **kwargs):
+    # After the commit, like invalidate_listings below.
+    transaction.on_commit(suggest.invalidate)
+
+
+@receiver(post_save, sender=Type)
+@receiver(post_delete, sender=Type)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def invalidate_reference_tables(sender, **kwargs):
+    transaction.on_commit(reference.invalidate)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Type)
+@receiver(post_delete, sender=Type)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def invalidate_listings(sender, **kwargs):
+    # Only once the write is visible, or a page read in between would be cached under the new generation.
+    # Bumping inside the transaction would also hold the generation's row in DatabaseCache locked until
+    # the commit, making every concurrent write wait for it.
+    transaction.on_commit(listings.invalidate)
+
+
+@receiver(pre_save, sender=Book)
+def remember_counted_values(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and dashboard.counts_change(update_fields):
+        instance._counted_before = dashboard.before_save(instance)
+
+
+@receiver(post_save, sender=Book)
+def count_saved_book(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and dashboard.counts_change(update_fields):
+        after = dashboard.values(instance)
+        dashboard.record_change(getattr(instance, "_counted_before", None), after)
+        instance._loaded_values = {**getattr(instance, "_loaded_values", {}), **after}
+
+
+@receiver(pre_delete, sender=Book)
+def uncount_deleted_book(sender, instance, origin=None, **kwargs):
+    # Runs in the delete's transaction, before the rows are gone. A queryset delete sends this once per book,
+    # so the whole queryset is counted off on the first one.
+    if isinstance(origin, QuerySet) and origin.model is Book:
+        if not getattr(origin, "_uncounted", False):
+            origin._uncounted = True
+            dashboard.uncount(origin)
+    else:
+        # Read from the database, since the instance may be stale (e.g. its language deleted since it was loaded).
+        dashboard.record_change(dashboard.stored(instance.pk), None)
+
+
+@receiver(post_delete, sender=Language)
+def uncount_deleted_language(sender, instance, **kwargs):
+    dashboard.forget("language", instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def uncount_deleted_registrator(sender, instance, **kwargs):
+    dashboard.forget("registrator", instance.pk)
@@ -362,6 +362,71 @@
     });
   }
 
+  if (document.getElementById("record-history")) {
+    const history = document.getElementById("record-history");
+    const tab = document.querySelector('[data-bs-target="#record-history"]');
+    let loaded = false;
+
+    const loadHistory = (cursor) => {
+      const url = new URL(history.dataset.historyUrl, window.location.origin);
+      if (cursor) {
+        url.searchParams.set("cursor", cursor);
+      }
+      fetch(url)
+        .then(response => response.text())
+        .then(html => {
+          history.innerHTML = html;
+        });
+    };
+
+    tab.addEventListener("shown.bs.tab", () => {
+      if (!loaded) {
+        loaded = true;
+        loadHistory("");
+      }
+    });
+    history.addEventListener("click", (event) => {
+      const link = event.target.closest("[data-history-cursor]");
+      if (link) {
+        event.preventDefault();
+        loadHistory(link.dataset.historyCursor);
+      }
+    });
+  }
+
+  if (document.getElementById("titleSuggestions")) {
+    const titleInput = document.getElementById("inputTitle");
+    const suggestions = document.getElementById("titleSuggestions");
+    let timer = null;
+    let controller = null;
+
+    titleInput.addEventListener("input", () => {
+      clearTimeout(timer);
+      timer = setTimeout(() => {
+        if (controller) {
+          controller.abort();
+        }
+        if (titleInput.value.trim().length < 2) {
+          suggestions.replaceChildren();
+          return;
+        }
+        controller = new AbortController();
+        const url = new URL(titleInput.dataset.suggestUrl, window.location.origin);
+        url.searchParams.set("q", titleInput.value);
+        fetch(url, {signal: controller.signal})
+          .then(response => response.json())
+          .then(data => {
+            suggestions.replaceChildren(...data.titles.map(book => {
+              const option = document.createElement("option");
+              option.value = book.title;
+              return option;
+            }));
+          })
+          .catch(() => {});
+      }, 150);
+    });
+  }
+
 
 
   if (document.getElementById("login-form")) {
@@ -436,23 +501,17 @@
 
   if (document.getElementById("query_results")) {
       const elements = [document.getElementById('first'), document.getElementById('last'), document.getElementById('next'), document.getElementById('previous')];
-      document.querySelectorAll('.num').forEach(number => {
-          elements.push(number)
-      })
       for (const elt of elements) {
         if (elt) {
-            console.log(elt)
             elt.addEventListener('click', (event) => {
                 event.preventDefault();
-                elt.href = window.location.href;
-                if (elt.href.indexOf('&page=') !== -1) {
-                    elt.href = elt.href.slice(0, elt.href.indexOf('&page='));
-                    elt.href += '&page=' + elt.dataset.page;
-                    console.log(elt.dataset.page)
+                const url = new URL(window.location.href);
+                if (elt.dataset.cursor) {
+                    url.searchParams.set('cursor', elt.dataset.cursor);
                 } else {
-                    elt.href += '&page=' + elt.dataset.page;
+                    url.searchParams.delete('cursor');
                 }
-                window.location.href = elt.href;
+                window.location.href = url.href;
             });
         }
     }
@@ -0,0 +1,137 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import DatabaseError, connection, transaction
+
+from . import routers
+from .caching import bump, generation
+from .models import Author, Book
+
+SUGGEST_LIMIT = 8
+MIN_QUERY_LENGTH = 2
+# Per-keystroke budget: a suggestion that arrives later than this is worse than none.
+SUGGEST_TIMEOUT_MS = 150
+# Same default as pg_trgm.word_similarity_threshold.
+WORD_SIMILARITY_THRESHOLD = 0.6
+GENERATION_KEY = "artax:suggest:generation"
+
+WORD = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def fold(text):
+    return "".join(char for char in unicodedata.normalize("NFKD", str(text).lower())
+                   if not unicodedata.combining(char))
+
+
+def trigrams(text):
+    """Trigrams the way pg_trgm builds them (words padded with two blanks in front and one behind), accent-folded."""
+    grams = set()
+    for word in WORD.findall(fold(text)):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """In-process inverted trigram index, the SQLite stand-in for a pg_trgm GIN index."""
+
+    def __init__(self, entries):
+        self.entries = {}
+        self.grams = {}
+        self.postings = defaultdict(set)
+        for pk, text in entries:
+            grams = trigrams(text)
+            self.entries[pk] = text
+            self.grams[pk] = grams
+            for gram in grams:
+                self.postings[gram].add(pk)
+
+    def search(self, text, limit=SUGGEST_LIMIT, threshold=WORD_SIMILARITY_THRESHOLD):
+        query = trigrams(text)
+        if not query:
+            return []
+        shared = defaultdict(int)
+        for gram in query:
+            for pk in self.postings.get(gram, ()):
+                shared[pk] += 1
+        # Share of the typed trigrams found in the entry (an approximation of word_similarity), with the
+        # plain Jaccard similarity breaking ties in favour of shorter, closer entries.
+        scored = []
+        for pk, count in shared.items():
+            word_similarity = count / len(query)
+            if word_similarity >= threshold:
+                similarity = count / len(query | self.grams[pk])
+                scored.append((word_similarity, similarity, pk))
+        scored.sort(key=lambda score: (-score[0], -score[1], self.entries[score[2]]))
+        return [(pk, self.entries[pk], word_similarity) for word_similarity, similarity, pk in scored[:limit]]
+
+
+_indexes = {}
+
+
+def invalidate():
+    bump(GENERATION_KEY)
+
+
+def _local_index(name, queryset, field):
+    current = generation(GENERATION_KEY)
+    cached = _indexes.get(name)
+    if cached is None or cached[0] != current:
+        with routers.filling_cache():
+            cached = (current, TrigramIndex(queryset.values_list("pk", field).iterator(chunk_size=2000)))
+        _indexes[name] = cached
+    return cached[1]
+
+
+def _pg_similar(table, column, text, limit):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id, {column}, word_similarity(%s, {column}) AS score FROM {table} "
+            f"WHERE %s <%% {column} ORDER BY score DESC, {column} LIMIT %s", [text, text, limit])
+        return cursor.fetchall()
+
+
+_pg_trgm = {}
+
+
+def uses_pg_trgm():
+    # Without the extension (a PostgreSQL built without contrib) the in-process index takes over.
+    if connection.vendor != "postgresql":
+        return False
+    if connection.alias not in _pg_trgm:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _pg_trgm[connection.alias] = cursor.fetchone() is not None
+    return _pg_trgm[connection.alias]
+
+
+def similar_titles(text, limit=SUGGEST_LIMIT):
+    if uses_pg_trgm():
+        return _pg_similar("artax_book", "title", text, limit)
+    return _local_index("titles", Book.objects.all(), "title").search(text, limit)
+
+
+def similar_authors(text, limit=SUGGEST_LIMIT):
+    if uses_pg_trgm():
+        return _pg_similar("artax_author", "name", text, limit)
+    return _local_index("authors", Author.objects.all(), "name").search(text, limit)
+
+
+def suggest(text, limit=SUGGEST_LIMIT):
+    """
+    Closest titles and authors to ``text``. Lookups that overrun SUGGEST_TIMEOUT_MS are cancelled by
+    the database and come back empty rather than holding up the next keystroke.
+    """
+    text = str(text).strip()
+    if len(text) < MIN_QUERY_LENGTH:
+        return [], []
+    if not uses_pg_trgm():
+        return similar_titles(text, limit), similar_authors(text, limit)
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", [SUGGEST_TIMEOUT_MS])
+            return similar_titles(text, limit), similar_authors(text, limit)
+    except DatabaseError:
+        return [], []
@@ -0,0 +1,66 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connections, transaction
+
+from . import search
+from .models import BookSummaryText
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+# Enough for any summary; keeps one runaway PDF from bloating the index.
+MAX_TEXT_LENGTH = 200_000
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summaries")
+
+
+def extract_text(path):
+    """Plain text of the PDF at ``path``. Needs only the file, so it is safe to run in a worker process."""
+    if PdfReader is None:
+        raise RuntimeError("pypdf is required to extract text from summaries.")
+    parts, length = [], 0
+    for page in PdfReader(path).pages:
+        text = page.extract_text() or ""
+        parts.append(text)
+        length += len(text)
+        if length >= MAX_TEXT_LENGTH:
+            break
+    return " ".join(" ".join(parts).split())[:MAX_TEXT_LENGTH]
+
+
+def store(book_id, summary_name, text):
+    with transaction.atomic():
+        BookSummaryText.objects.update_or_create(book_id=book_id,
+                                                 defaults={"summary_name": summary_name, "text": text})
+        search.index_book(book_id)
+
+
+def clear(book_id):
+    with transaction.atomic():
+        if BookSummaryText.objects.filter(book_id=book_id).delete()[0]:
+            search.index_book(book_id)
+
+
+def is_current(book_id, summary_name):
+    return BookSummaryText.objects.filter(book_id=book_id, summary_name=summary_name).exists()
+
+
+def _extract_and_store(book_id, summary_name):
+    close_old_connections()
+    try:
+        store(book_id, summary_name, extract_text(default_storage.path(summary_name)))
+    except Exception:
+        logger.exception("Could not extract the text of %s", summary_name)
+    finally:
+        connections.close_all()
+
+
+def schedule(book_id, summary_name):
+    """Extracts the summary on a background thread once the upload's transaction has committed."""
+    transaction.on_commit(lambda: _executor.submit(_extract_and_store, book_id, summary_name))
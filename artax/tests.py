@@ -1,3 +1,445 @@
-from django.test import TestCase
+import importlib
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timezone
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import Permission
+from django.contrib.sessions.models import Session
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import OperationalError, transaction
+from django.db.models.functions import Length
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+
+from . import caching, listings, numbering, routers
+from .db.pool import ConnectionPool, PoolTimeout
+from .middleware import ReplicaPinningMiddleware
+from .models import Author, Book, Language, LibIdCounter, Location, Type, User
+from .pagination import NEXT, PREVIOUS, encode_cursor, keyset_page
+
+
+def make_book(lib_id, book_type=None, **fields):
+    book_type = book_type or Type.objects.get_or_create(name="Law", code="LAW")[0]
+    return Book.objects.create(
+        lib_id=lib_id, title=fields.pop("title", f"Book {lib_id}"), type=book_type,
+        author=Author.objects.get_or_create(name="Author")[0], location=Location.objects.get_or_create(code="A1")[0],
+        language=Language.objects.get_or_create(name="English", code="en")[0], section="1", publisher="Publisher",
+        number_of_copies=1, last_edit_time=datetime(2024, 1, 1, tzinfo=timezone.utc), **fields,
+    )
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def pool(self, **options):
+        self.opened = []
+        self.healthy = True
+
+        def connect():
+            self.opened.append(FakeConnection())
+            return self.opened[-1]
+
+        return ConnectionPool("test", connect, lambda connection: self.healthy, **options)
+
+    def test_returned_connection_is_reused(self):
+        pool = self.pool()
+        first = pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_most_recently_returned_connection_goes_out_first(self):
+        pool = self.pool()
+        first, second = pool.checkout(), pool.checkout()
+        pool.checkin(first)
+        pool.checkin(second)
+        self.assertIs(pool.checkout(), second)
+
+    def test_checkout_times_out_when_all_connections_are_in_use(self):
+        pool = self.pool(max_size=2, timeout=0.05)
+        pool.checkout(), pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        self.assertEqual(len(self.opened), 2)
+
+    def test_waiting_checkout_gets_the_returned_connection(self):
+        pool = self.pool(max_size=1, timeout=5)
+        pooled = pool.checkout()
+        threading.Timer(0.05, pool.checkin, (pooled,)).start()
+        self.assertIs(pool.checkout(), pooled)
+
+    def test_unusable_connection_is_discarded(self):
+        pool = self.pool(max_size=1, timeout=0.05)
+        pooled = pool.checkout()
+        pool.checkin(pooled, reusable=False)
+        self.assertTrue(pooled.connection.closed)
+        self.assertIsNot(pool.checkout(), pooled)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_broken_idle_connection_is_replaced(self):
+        pool = self.pool(check_after=0)
+        pooled = pool.checkout()
+        pool.checkin(pooled)
+        self.healthy = False
+        self.assertIsNot(pool.checkout(), pooled)
+        self.assertTrue(pooled.connection.closed)
+
+    def test_expired_connection_is_replaced(self):
+        pool = self.pool(max_lifetime=0)
+        pooled = pool.checkout()
+        pool.checkin(pooled)
+        self.assertTrue(pooled.connection.closed)
+        self.assertIsNot(pool.checkout(), pooled)
+
+
+class PooledBackendTests(SimpleTestCase):
+    """The pooled SQLite stand-in, which shares PooledDatabaseWrapper with the PostgreSQL backend."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # A database of its own per test, so that each gets a fresh pool.
+        self.settings_dict = {
+            "ENGINE": "artax.db.sqlite3", "NAME": os.path.join(directory, "pooled.sqlite3"),
+            "POOL": {"MAX_SIZE": 2, "TIMEOUT": 0.05},
+        }
+        self.connection = self.new_connection()
+
+    def new_connection(self):
+        connection = ConnectionHandler({"default": self.settings_dict})["default"]
+        self.addCleanup(connection.close)
+        return connection
+
+    def raw_connection(self):
+        self.connection.ensure_connection()
+        return self.connection.connection
+
+    def test_closed_connection_goes_back_to_the_pool(self):
+        first = self.raw_connection()
+        self.connection.close()
+        self.assertIsNone(self.connection.connection)
+        self.assertIs(self.raw_connection(), first)
+        self.assertEqual(len(self.connection.pool.idle), 0)
+
+    def test_connection_closed_inside_atomic_is_discarded(self):
+        first = self.raw_connection()
+        with mock.patch.object(transaction, "get_connection", return_value=self.connection):
+            with transaction.atomic():
+                self.connection.close()
+        self.assertEqual(self.connection.pool.size, 0)
+        self.assertIsNot(self.raw_connection(), first)
+
+    def test_connections_share_the_pool_up_to_its_size(self):
+        self.raw_connection()
+        self.new_connection().ensure_connection()
+        with self.assertRaises(OperationalError):
+            self.new_connection().ensure_connection()
+
+
+@mock.patch.object(routers, "REPLICAS", ("replica1",))
+class ReplicaRouterTests(TransactionTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.addCleanup(routers.stop)
+
+    def test_reads_outside_of_requests_go_to_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Book), "default")
+
+    def test_request_reads_go_to_a_replica(self):
+        routers.start(pinned=False)
+        self.assertEqual(self.router.db_for_read(Book), "replica1")
+
+    def test_pinned_request_reads_go_to_the_primary(self):
+        routers.start(pinned=True)
+        self.assertEqual(self.router.db_for_read(Book), "default")
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        routing = routers.start(pinned=False)
+        self.assertEqual(self.router.db_for_write(Book), "default")
+        self.assertTrue(routing.wrote)
+        self.assertEqual(self.router.db_for_read(Book), "default")
+
+    def test_reads_inside_a_transaction_go_to_the_primary(self):
+        routers.start(pinned=False)
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Book), "default")
+        self.assertEqual(self.router.db_for_read(Book), "replica1")
+
+    def test_sessions_are_read_from_the_primary(self):
+        routing = routers.start(pinned=False)
+        self.assertEqual(self.router.db_for_read(Session), "default")
+        self.router.db_for_write(Session)
+        self.assertFalse(routing.wrote)
+
+    def test_cache_fills_just_after_a_write_read_from_the_primary(self):
+        routers.start(pinned=False)
+        caching.bump("artax:test-generation")
+        with routers.filling_cache():
+            self.assertEqual(self.router.db_for_read(Book), "default")
+        self.assertEqual(self.router.db_for_read(Book), "replica1")
+
+
+@mock.patch.object(routers, "REPLICAS", ("replica1",))
+class ReplicaPinningMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = routers.ReplicaRouter()
+
+    def view(self, request):
+        if request.method == "POST":
+            self.router.db_for_write(Book)
+        self.read_from = self.router.db_for_read(Book)
+        return HttpResponse()
+
+    def get(self, request):
+        return ReplicaPinningMiddleware(self.view)(request)
+
+    def test_safe_request_reads_from_a_replica(self):
+        response = self.get(self.factory.get("/"))
+        self.assertEqual(self.read_from, "replica1")
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_unsafe_request_reads_from_the_primary_and_pins_the_browser(self):
+        response = self.get(self.factory.post("/"))
+        self.assertEqual(self.read_from, "default")
+        cookie = response.cookies[routers.PIN_COOKIE]
+        self.assertEqual(cookie["max-age"], routers.PIN_SECONDS)
+        self.assertTrue(cookie["httponly"])
+
+    def test_pinned_browser_reads_from_the_primary(self):
+        request = self.factory.get("/")
+        request.COOKIES[routers.PIN_COOKIE] = "1"
+        self.get(request)
+        self.assertEqual(self.read_from, "default")
+
+    def test_routing_ends_with_the_request(self):
+        self.get(self.factory.get("/"))
+        self.assertEqual(self.router.db_for_read(Book), "default")
+
+    def test_not_used_without_replicas(self):
+        with mock.patch.object(routers, "REPLICAS", ()):
+            with self.assertRaises(MiddlewareNotUsed):
+                ReplicaPinningMiddleware(self.view)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [Author.objects.create(name=name) for name in ("a", "bb", "cc", "d", "ee")]
+
+    def names(self, page):
+        return [author.name for author in page]
+
+    def test_pages_follow_each_other(self):
+        first = keyset_page(Author.objects.all(), None, 2)
+        self.assertEqual(self.names(first), ["a", "bb"])
+        self.assertTrue(first.has_next)
+        self.assertFalse(first.has_previous)
+        second = keyset_page(Author.objects.all(), first.next_cursor, 2)
+        self.assertEqual(self.names(second), ["cc", "d"])
+        self.assertEqual(self.names(keyset_page(Author.objects.all(), second.previous_cursor, 2)), ["a", "bb"])
+
+    def test_last_page(self):
+        last = keyset_page(Author.objects.all(), encode_cursor(PREVIOUS, None), 2)
+        self.assertEqual(self.names(last), ["d", "ee"])
+        self.assertFalse(last.has_next)
+        self.assertTrue(last.has_previous)
+
+    def test_descending(self):
+        first = keyset_page(Author.objects.all(), None, 2, descending=True)
+        self.assertEqual(self.names(first), ["ee", "d"])
+        self.assertEqual(self.names(keyset_page(Author.objects.all(), first.next_cursor, 2, descending=True)),
+                         ["cc", "bb"])
+
+    def test_backward_cursor_before_the_first_row_gives_an_empty_page(self):
+        page = keyset_page(Author.objects.all(), encode_cursor(PREVIOUS, [self.authors[0].pk]), 2)
+        self.assertEqual(len(page), 0)
+        self.assertFalse(page.has_other_pages())
+        self.assertIsNone(page.next_cursor)
+        self.assertIsNone(page.previous_cursor)
+
+    def test_forward_cursor_past_the_last_row_gives_an_empty_page(self):
+        page = keyset_page(Author.objects.all(), encode_cursor(NEXT, [self.authors[-1].pk]), 2)
+        self.assertEqual(len(page), 0)
+        self.assertFalse(page.has_other_pages())
+
+    def test_malformed_cursor_gives_the_first_page(self):
+        for cursor in ("garbage", encode_cursor("x", [1]), encode_cursor(NEXT, ["1"]), encode_cursor(NEXT, [1, 2])):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.names(keyset_page(Author.objects.all(), cursor, 2)), ["a", "bb"])
+
+    def test_composite_key_breaks_ties_on_the_last_key(self):
+        authors = Author.objects.annotate(length=Length("name"))
+        first = keyset_page(authors, None, 2, keys=("length", "pk"))
+        self.assertEqual(self.names(first), ["a", "d"])
+        second = keyset_page(authors, first.next_cursor, 2, keys=("length", "pk"))
+        self.assertEqual(self.names(second), ["bb", "cc"])
+        self.assertEqual(self.names(keyset_page(authors, second.next_cursor, 2, keys=("length", "pk"))), ["ee"])
+
+
+class NumberingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.law = Type.objects.create(name="Law", code="LAW")
+
+    def test_numbers_are_consecutive(self):
+        self.assertEqual(numbering.allocate("LAW"), 1)
+        self.assertEqual(numbering.allocate("LAW", 3), 2)
+        self.assertEqual(numbering.allocate("LAW"), 5)
+
+    def test_rolled_back_numbers_are_handed_out_again(self):
+        with transaction.atomic():
+            numbering.allocate("LAW")
+            transaction.set_rollback(True)
+        self.assertEqual(numbering.allocate("LAW"), 1)
+
+    def test_types_sharing_a_code_share_a_counter(self):
+        other = Type.objects.create(name="Other law", code="law")
+        self.assertEqual(numbering.next_lib_id(self.law), "LAW1")
+        self.assertEqual(numbering.next_lib_id(other), "law2")
+
+    def test_new_counter_starts_after_special_ids_of_its_code_on_any_type(self):
+        make_book("LAW7", book_type=Type.objects.create(name="Misfiled", code="MIS"))
+        self.assertEqual(numbering.next_lib_id(self.law), "LAW8")
+
+    def test_taken_special_ids_are_skipped(self):
+        numbering.allocate("LAW")
+        make_book("LAW2")
+        self.assertEqual(numbering.next_lib_id(self.law), "LAW3")
+
+    def test_advance_never_moves_back(self):
+        numbering.advance("law", 10)
+        numbering.advance("LAW", 4)
+        self.assertEqual(numbering.allocate("LAW"), 11)
+
+    def test_migration_backfill_starts_each_code_after_its_highest_special_id(self):
+        Type.objects.create(name="Other law", code="law")
+        make_book("LAW3")
+        make_book("law9", book_type=Type.objects.create(name="Misfiled", code="MIS"))
+        make_book("ABC")
+        LibIdCounter.objects.all().delete()
+        importlib.import_module("artax.migrations.0017_libidcounter").backfill_counters(apps, None)
+        self.assertEqual(dict(LibIdCounter.objects.values_list("code", "last_number")), {"LAW": 9, "MIS": 0})
+
+
+class ListingCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user("viewer", email="viewer@example.com")
+        cls.other_viewer = User.objects.create_user("other", email="other@example.com")
+        cls.editor = User.objects.create_user("editor", email="editor@example.com")
+        cls.editor.user_permissions.add(Permission.objects.get(codename="change_book"))
+        make_book("LAW1")
+
+    def setUp(self):
+        self.builds = 0
+        render = mock.patch.object(listings, "render_to_string", wraps=listings.render_to_string)
+        self.render = render.start()
+        self.addCleanup(render.stop)
+
+    def table(self, user, params=None):
+        request = RequestFactory().get("/books/")
+        request.user = User.objects.get(pk=user.pk)
+
+        def build():
+            self.builds += 1
+            return keyset_page(Book.objects.for_listing(), None, 10)
+
+        return listings.table(request, "books", params or {"cursor": None}, Book.objects.for_listing(), build)
+
+    def test_repeat_request_is_not_built_again(self):
+        self.table(self.viewer)
+        html, page = self.table(self.viewer)
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(self.render.call_count, 1)
+        self.assertIn("LAW1", html)
+        self.assertEqual(len(page), 1)
+
+    def test_other_parameters_are_cached_apart(self):
+        self.table(self.viewer)
+        self.table(self.viewer, {"cursor": "next"})
+        self.assertEqual(self.builds, 2)
+
+    def test_users_with_the_same_permissions_share_a_table(self):
+        self.table(self.viewer)
+        self.table(self.other_viewer)
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_users_with_other_permissions_get_their_own_table_of_the_same_rows(self):
+        self.table(self.viewer)
+        self.table(self.editor)
+        self.assertEqual(self.render.call_count, 2)
+        self.assertEqual(self.builds, 1)
+
+    def test_committed_write_retires_cached_tables(self):
+        self.table(self.viewer)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_book("LAW2")
+        html, page = self.table(self.viewer)
+        self.assertEqual(self.builds, 2)
+        self.assertIn("LAW2", html)
+
+    def test_uncommitted_write_does_not(self):
+        self.table(self.viewer)
+        with self.captureOnCommitCallbacks(execute=False):
+            make_book("LAW2")
+        self.table(self.viewer)
+        self.assertEqual(self.builds, 1)
+
+
+class BookDetailRevalidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("viewer", email="viewer@example.com")
+        cls.book = make_book("LAW1")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse("show_book", kwargs={"book_id": self.book.pk})
+        # The page embeds forms, so the CSRF cookie its first response sets is part of the ETag.
+        self.client.get(self.url)
+
+    def test_unchanged_page_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_edited_book_is_sent_again(self):
+        etag = self.client.get(self.url)["ETag"]
+        Book.objects.filter(pk=self.book.pk).update(last_edit_time=datetime(2024, 2, 1, tzinfo=timezone.utc))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cover_change_is_sent_again(self):
+        etag = self.client.get(self.url)["ETag"]
+        Book.objects.filter(pk=self.book.pk).update(cover="cover/1-cover.png")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_lookup_table_change_is_sent_again(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Language.objects.create(name="French", code="fr")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_page_is_private_to_the_user(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.client.force_login(User.objects.create_user("other", email="other@example.com"))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_modified_since_alone_is_not_answered_with_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header("Last-Modified"))
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT")
+        self.assertEqual(response.status_code, 200)
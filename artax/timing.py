@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+_current = ContextVar("artax_timings", default=None)
+_templates_instrumented = False
+
+
+class Timings:
+    """Time spent per kind of work ("sql", "template", "qr", ...) during one request, and how often."""
+
+    def __init__(self):
+        self.spans = {}
+        self.depth = {}
+
+    def add(self, name, seconds):
+        total, count = self.spans.get(name, (0.0, 0))
+        self.spans[name] = (total + seconds, count + 1)
+
+    def enter(self, name):
+        # Only the outermost of nested spans of one kind is timed, so nothing is counted twice.
+        depth = self.depth.get(name, 0)
+        self.depth[name] = depth + 1
+        return depth == 0
+
+    def leave(self, name):
+        self.depth[name] -= 1
+
+
+def start():
+    timings = Timings()
+    _current.set(timings)
+    return timings
+
+
+def stop():
+    # Not a reset to a token: under ASGI, start and stop run in different copies of the request's context.
+    _current.set(None)
+
+
+@contextmanager
+def span(name):
+    """Times the block as ``name`` in the current request's timings; free outside of an instrumented request."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    outermost = timings.enter(name)
+    began = perf_counter()
+    try:
+        yield
+    finally:
+        if outermost:
+            timings.add(name, perf_counter() - began)
+        timings.leave(name)
+
+
+class QueryTimer:
+    """Database execute wrapper that adds every query to the current request's "sql" span."""
+
+    def __call__(self, execute, sql, params, many, context):
+        with span("sql"):
+            return execute(sql, params, many, context)
+
+
+def instrument_templates():
+    """Times every Django template render as "template"; includes and tags run inside the outer render."""
+    global _templates_instrumented
+    if _templates_instrumented:
+        return
+    from django.template.backends.django import Template
+
+    render = Template.render
+
+    def timed_render(self, context=None, request=None):
+        with span("template"):
+            return render(self, context, request)
+
+    Template.render = timed_render
+    _templates_instrumented = True
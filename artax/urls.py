@@ -1,14 +1,13 @@
 from django.urls import path, re_path
-from . import views
+from . import media, views
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth.decorators import login_required
-from django.views.static import serve
 
 
 urlpatterns = [
     path("", views.index, name="index"),
-    re_path(r'^media/(?P<path>.*)$', login_required(serve), {'document_root': settings.MEDIA_ROOT}),
+    re_path(r'^media/(?P<path>.*)$', login_required(media.serve), name="media"),
     path("faq/", views.faq, name="faq"),
     path("contact/", views.contact, name="contact"),
     path("blank/", views.blank, name="blank"),
@@ -28,7 +27,11 @@ urlpatterns = [
     path("books/queries/", views.book_queries, name="book_queries"),
     path("books/", views.all_books, name="all_books"),
     path("books/query-by/", views.query_books_by, name="query_books_by"),
+    path("books/suggest/", views.suggest_books, name="suggest_books"),
+    path("books/labels/", views.book_labels, name="book_labels"),
+    path("books/export/", views.export_books, name="export_books"),
     path("books/<int:book_id>/", views.show_book, name="show_book"),
+    path("books/<int:book_id>/history/", views.book_history, name="book_history"),
     path("books/delete-book/<int:book_id>/", views.delete_book, name="delete_book"),
     path('books/qrcode/<str:string_to_encode>/', views.generate_qr_code, name='generate_qr_code'),
     path('download_qr_code/<str:string_to_encode>/', views.download_qr_code, name='download_qr_code'),
@@ -40,6 +43,7 @@ urlpatterns = [
     path("files/delete-file/<int:file_id>/", views.delete_file, name="delete_file"),
     path("clients/", views.all_clients, name="all_clients"),
     path("clients/new-client/", views.new_client, name="new_client"),
+    path("metrics", views.prometheus_metrics, name="metrics"),
 ]
 
 if settings.DEBUG:
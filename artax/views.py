@@ -1,22 +1,29 @@
+import asyncio
+import hashlib
 from datetime import datetime
+from functools import partial
 from smtplib import SMTPRecipientsRefused
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate, login, logout, update_session_auth_hash
 # from django.contrib.sites.shortcuts import get_current_site
+from django.conf import settings
 from django.contrib.auth.models import Group
 from django.core.files.storage import default_storage
-from django.db import IntegrityError
-from django.http import HttpResponse, Http404
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import FileResponse, HttpResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, permission_required
+from django.views.decorators.cache import cache_control
 from .models import User, Book, Client, File, Author, Type, Location, Language
+from .pagination import keyset_page
+from . import (asyncviews, audit, covers, dashboard, export, labels, listings, metrics, numbering, qr, reference,
+               revisions, search, suggest)
 from django.core.paginator import Paginator
 from django.core.exceptions import ObjectDoesNotExist, ValidationError, PermissionDenied
 from django.contrib import messages
-import qrcode
-import qrcode.image.svg
 import logging
-import user_agents
-from django.core import serializers
 from django.db.models import Q
 # from pillow import Image, ImageDraw, ImageFont
 # from django.contrib.auth.tokens import default_token_generator
@@ -34,6 +41,16 @@ BASE_URL = ''
 
 per_page = 35
 
+# What record-book.html shows of a book that can change without last_edit_time: the cover and summary views
+# leave it alone, and the labels of the related rows change with those rows.
+BOOK_DETAIL_VERSION = (
+    "last_edit_time", "cover", "summary", "author__name", "type__name", "location__code", "language__name",
+    "registrator__first_name", "registrator__last_name", "last_editor__first_name", "last_editor__last_name",
+)
+
+# User fields written to the audit log when a profile is edited.
+PROFILE_FIELDS = ("first_name", "last_name", "job", "address", "phone", "email", "about")
+
 
 def redirect_view(function):
     def _function(request, *args, **kwargs):
@@ -54,34 +71,58 @@ def staff_required(function):
 
 @login_required
 def index(request):
-    return render(request, "artax/dashboard.html")
+    return render(request, "artax/dashboard.html", dashboard.context())
 
 
-def generate_qr_code(request, string_to_encode):
-    qr = qrcode.QRCode(
-        version=2,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=8,
-        border=4,
-    )
-    qr.add_data(f"{request.get_host()}/{string_to_encode}")
-    qr.make(fit=True)
+def qr_code_payload(request, string_to_encode):
+    return f"{request.get_host()}/{string_to_encode}"
 
-    img = qr.make_image(fill_color="black", back_color="white")
-    response = HttpResponse(content_type="image/png")
-    img.save(response, "PNG")
-    return response
+
+def qr_code_format(request):
+    image_format = request.GET.get("format", "png")
+    return image_format if image_format in qr.FORMATS else "png"
+
+
+def qr_code_etag(request, string_to_encode):
+    return qr.cache_key(qr_code_payload(request, string_to_encode), qr_code_format(request))
+
+
+async def qr_code_image(request, string_to_encode):
+    image_format = qr_code_format(request)
+    payload = qr_code_payload(request, string_to_encode)
+    content = qr.qr_cache.recall(qr.cache_key(payload, image_format))
+    if content is None:
+        # Reading the disk cache or rendering blocks, but needs no database, so any pool thread will do.
+        _, content = await sync_to_async(qr.qr_cache.get, thread_sensitive=False)(payload, image_format)
+    return HttpResponse(content, content_type=qr.FORMATS[image_format])
+
+
+@asyncviews.login_required(login_url="login")
+@asyncviews.cache_control(private=True, max_age=86400)
+@asyncviews.condition(etag_func=qr_code_etag)
+async def generate_qr_code(request, string_to_encode):
+    return await qr_code_image(request, string_to_encode)
 
 
-def download_qr_code(request, string_to_encode):
-    qr_code_response = generate_qr_code(request, string_to_encode)
-    qr_code_data = qr_code_response.content
-    response = HttpResponse(content_type="image/png")
-    response["Content-Disposition"] = f"attachment; filename=qr_code.png"
-    response.write(qr_code_data)
+@asyncviews.login_required(login_url="login")
+@asyncviews.cache_control(private=True, max_age=86400)
+@asyncviews.condition(etag_func=qr_code_etag)
+async def download_qr_code(request, string_to_encode):
+    response = await qr_code_image(request, string_to_encode)
+    response["Content-Disposition"] = f"attachment; filename=qr_code.{qr_code_format(request)}"
     return response
 
 
+@cache_control(no_store=True)
+def prometheus_metrics(request):
+    """The counters of all workers in the Prometheus text format, for staff and scrapers (see metrics.authorized)."""
+    if not metrics.registry.enabled:
+        raise Http404("Metrics are disabled.")
+    if not metrics.authorized(request):
+        raise PermissionDenied
+    return HttpResponse(metrics.registry.exposition(), content_type=metrics.CONTENT_TYPE)
+
+
 def under_construction(request):
     return render(request, "artax/under-construction.html")
 
@@ -120,8 +161,10 @@ def login_view(request):
         else:
             if not remember_me:
                 request.session.set_expiry(0)
-            user_logger.info(f"User {username} (User ID: {user.id}) logged on {datetime.now()}"
-                        f" with user-agent {user_agents.parse(request.META.get('HTTP_USER_AGENT', ''))}")
+            user_logger.info("User %s (User ID: %s) logged in", username, user.id, extra={
+                "event": "login", "user_id": user.id, "username": username,
+                "user_agent": request.META.get("HTTP_USER_AGENT", ""),
+            })
             login(request, user)
             return redirect('profile')
     return render(request, "artax/login.html")
@@ -202,6 +245,7 @@ def new_user(request):
 def profile(request):
     if request.method == "POST":
         current_user = request.user
+        before = audit.snapshot(current_user, PROFILE_FIELDS)
         current_user.first_name = request.POST.get("firstName")
         current_user.last_name = request.POST.get("lastName")
         current_user.job = request.POST.get("job")
@@ -210,9 +254,9 @@ def profile(request):
         current_user.email = request.POST.get("email")
         current_user.about = request.POST.get("about")
         current_user.save()
-        user_logger.info(f"User {request.user.username} (User ID: {request.user.pk}) edited his profile on {datetime.now()}.")
-        user_logger.info(f"Old User: {serializers.serialize('json', request.user)}")
-        user_logger.info(f"New User: {serializers.serialize('json', current_user)}")
+        user_logger.info("User %s (User ID: %s) edited their profile", current_user.username, current_user.pk,
+                         extra={"event": "profile", "user_id": current_user.pk, "username": current_user.username,
+                                "before": before, "after": audit.snapshot(current_user, PROFILE_FIELDS)})
 
     context = {}
     for user_group in request.user.groups.values_list('name', flat=True):
@@ -241,7 +285,9 @@ def change_password(request):
         else:
             user.set_password(new_password)
             user.save()
-            user_logger.info(f"User {request.user.username} (User ID: {request.user.pk}) changed his password on {datetime.now()}")
+            user_logger.info("User %s (User ID: %s) changed their password", user.username, user.pk, extra={
+                "event": "password", "user_id": user.pk, "username": user.username,
+            })
             update_session_auth_hash(request, request.user)
             return redirect("profile")
     return redirect("profile")
@@ -251,7 +297,9 @@ def change_password(request):
 def logout_view(request):
     user = request.user
     logout(request)
-    user_logger.info(f"User {user.username} (User ID: {user.pk}) logged out on {datetime.now()}")
+    user_logger.info("User %s (User ID: %s) logged out", user.username, user.pk, extra={
+        "event": "logout", "user_id": user.pk, "username": user.username,
+    })
     return redirect("login")
 
 
@@ -259,17 +307,19 @@ def logout_view(request):
 
 @login_required(login_url="login")
 def all_books(request):
-    page_obj = paginator_books(request, Book.objects.all())
-    return render(request, "artax/all-books.html", {"page_obj": page_obj})
+    books = Book.objects.for_listing()
+    table, page_obj = listings.table(request, "books", listing_params(request), books,
+                                     partial(paginator_books, request, books))
+    return render(request, "artax/all-books.html", {"table": table, "page_obj": page_obj})
 
 
 def paginator_books(request, books):
-    page_number = request.GET.get('page')
-    if request.GET.get("asc") == 'False':
-        books = books[::-1]
-    paginator = Paginator(books, per_page)
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    return keyset_page(books, request.GET.get("cursor"), per_page, descending=request.GET.get("asc") == 'False')
+
+
+def listing_params(request):
+    # What decides the rows of a book listing page besides the query itself.
+    return {"cursor": request.GET.get("cursor"), "descending": request.GET.get("asc") == 'False', "per_page": per_page}
 
 
 @permission_required("artax.change_book", raise_exception=True)
@@ -278,8 +328,9 @@ def remove_book_summary(request, book_id):
     if request.method == 'POST':
         if book.summary:
             default_storage.delete(book.summary.path)
-            book.summary = None
-            book.save()
+            with revisions.track(book, request.user):
+                book.summary = None
+                book.save()
     return redirect('show_book', book_id=book_id)
 
 
@@ -288,9 +339,11 @@ def remove_book_cover(request, book_id):
     book = get_object_or_404(Book, id=book_id)
     if request.method == 'POST':
         if book.cover:
+            covers.delete(book.cover.name)
             default_storage.delete(book.cover.path)
-            book.cover = None
-            book.save()
+            with revisions.track(book, request.user):
+                book.cover = None
+                book.save()
     return redirect('show_book', book_id=book_id)
 
 
@@ -302,8 +355,9 @@ def change_book_summary(request, book_id):
         if book_summary.content_type != "application/pdf":
             messages.warning(request, "File type for image summary invalid.")
             return redirect("show_book", book_id=book_id)
-        book.summary = book_summary
-        book.save()
+        with revisions.track(book, request.user):
+            book.summary = book_summary
+            book.save()
     return redirect('show_book', book_id=book_id)
 
 
@@ -315,8 +369,9 @@ def change_book_cover(request, book_id):
         if book_cover.content_type != "image/png" and book_cover.content_type != "image/jpg" and book_cover.content_type != "image/jpeg":
             messages.warning(request, "File type for image cover invalid.")
             return redirect("show_book", book_id=book_id)
-        book.cover = book_cover
-        book.save()
+        with revisions.track(book, request.user):
+            book.cover = book_cover
+            book.save()
     return redirect('show_book', book_id=book_id)
 
 
@@ -327,17 +382,15 @@ def new_book(request):
         book_id = 1
     else:
         book_id = book_record.id + 1
-    types, authors, locations, languages = Type.objects.all(), Author.objects.all(), Location.objects.all().order_by("code"), Language.objects.all()
     if request.method == "POST":
         if not request.user.has_perm("artax.add_book"):
             raise PermissionDenied
         else:
-            if Book.objects.filter(title=request.POST.get("bookTitle")).first():
+            if Book.objects.filter(title=request.POST.get("bookTitle")).exists():
                 messages.warning(request, "A book already exists with that title. Choose another one and try again.")
                 return redirect('new_book')
             else:
                 book_type = Type.objects.get(pk=request.POST.get("bookType"))
-                special_id = f"{book_type.code}{Book.objects.filter(type=book_type).count() + 1}"
 
                 purchase_date = request.POST.get("purchaseDate")
                 if purchase_date == '':
@@ -354,7 +407,6 @@ def new_book(request):
                     return redirect("new_book")
 
                 new_book_record = Book(
-                    lib_id=special_id,
                     author=Author.objects.get(pk=request.POST.get("authorName")),
                     title=request.POST.get("bookTitle"),
                     subject=request.POST.get("subject", None),
@@ -362,8 +414,6 @@ def new_book(request):
                     section=request.POST.get("bookSection", None),
                     location=Location.objects.get(pk=request.POST.get("bookLocation")),
                     language=Language.objects.get(pk=request.POST.get("bookLanguage")),
-                    summary=book_summary,
-                    cover=book_cover,
                     publisher=request.POST.get("publisher"),
                     publishing_date=request.POST.get("publishingYear"),
                     purchase_date=purchase_date,
@@ -374,85 +424,168 @@ def new_book(request):
                     last_edit_time=datetime.now(),
                 )
                 try:
-                    new_book_record.save()
+                    # The special ID's number is only taken if the book is saved; the files are attached
+                    # once the book has its pk, which names them.
+                    with transaction.atomic():
+                        new_book_record.lib_id = numbering.next_lib_id(book_type)
+                        new_book_record.save()
+                        if book_summary is not None or book_cover is not None:
+                            new_book_record.summary = book_summary
+                            new_book_record.cover = book_cover
+                            new_book_record.save()
                 except ValueError as error:
                     messages.warning(request, f"ValueError: {error}")
                     return redirect("new_book")
                 except ValidationError as error:
                     messages.warning(request, f"ValidationError: {error}")
                     return redirect("new_book")
+                except IntegrityError:
+                    messages.warning(request, f"Special ID {new_book_record.lib_id} is already in use, please try again.")
+                    return redirect("new_book")
+                book_id = new_book_record.id
+                book_logger.info("Book %s (%s) added by %s", book_id, new_book_record.lib_id, request.user.username,
+                                 extra={"event": "create", "book_id": book_id, "user_id": request.user.pk,
+                                        "username": request.user.username})
             return redirect("show_book", book_id=book_id)
-    return render(request, "artax/new-book.html", {"book_id": book_id, "types": types, "locations": locations,
-                                                   "authors": authors, "languages": languages,
+    return render(request, "artax/new-book.html", {"book_id": book_id, **reference.lookups(),
                                                    "url_arg": f"{BASE_URL}books%2F{book_id}%2F"})
 
 
 @login_required(login_url="login")
 def book_queries(request):
-    context = {
-        "types": Type.objects.all(),
-        "authors": Author.objects.all(),
-        "locations": Location.objects.all(),
-        "languages": Language.objects.all(),
-    }
-    return render(request, "artax/queries-books.html", context)
+    return render(request, "artax/queries-books.html", reference.lookups())
 
 
 @login_required
 def query_books_by(request):
     book_query_param = request.GET.get("book_query_param")
     book_param = request.GET.get("name")
-    books = Book.objects.all().order_by("id")
     if book_query_param == "id" or book_query_param == "special_id":
-        print(RED + str(book_query_param))
-        print(str(book_param) + RESET)
-        book = get_object_or_404(Book, lib_id=f"{book_param}{request.GET.get('name_id')}") if book_query_param == "special_id" else get_object_or_404(Book, pk=book_param)
-        if book is None or book == []:
-            print(RED + "404044040440404040")
-            return render(request, "artax/record-404.html", {'param': "book"})
+        if book_query_param == "special_id":
+            lookup = {"lib_id": f"{book_param}{request.GET.get('name_id')}"}
         else:
-            return redirect("show_book", book_id=book.id)
+            lookup = {"pk": book_param}
+        book_id = Book.objects.filter(**lookup).values_list("id", flat=True).first()
+        if book_id is None:
+            raise Http404("No Book matches the given query.")
+        return redirect("show_book", book_id=book_id)
+
+    books = Book.objects.for_listing()
+    results, search_terms = search.query_books(books, request.GET)
+    if any(search.tokenize(text) for text in search_terms.values()):
+        build = partial(keyset_page, results, request.GET.get("cursor"), per_page, descending=True,
+                        keys=("rank", "pk"))
     else:
-        filters = {
-            "type": ("type__name__icontains", "type"),
-            "location": ("location__code__icontains", "location"),
-            "title": ("title__icontains", "title"),
-            "content": ("subject__icontains", "content"),
-            "language": ("language__code__icontains", "language"),
-            "author": ("author__name__icontains", "author"),
-            "publisher": ("publisher__icontains", "publisher"),
-        }
-        filter_params = {}
-        for field, (lookup, param_name) in filters.items():
-            value = request.GET.get(param_name)
-            if value != "0" and str(value).strip() != "":
-                filter_params[lookup] = value
-
-        if filter_params:
-            books = books.filter(**filter_params)
-
-    if books.exists() is False:
+        build = partial(paginator_books, request, results)
+    params = {**search.query_params(request.GET), **listing_params(request)}
+    table, page_obj = listings.table(request, "query", params, books, build)
+    if not page_obj.object_list:
         context = {'param': "book"}
+        if search_terms["title"]:
+            context["suggestions"], _ = suggest.suggest(search_terms["title"])
         return render(request, "artax/record-404.html", context)
-    else:
-        page_number = request.GET.get('page')
-        paginator = Paginator(books, per_page)
-        page_obj = paginator.get_page(page_number)
-        return render(request, 'artax/query-results.html', {'page_obj': page_obj})
+    return render(request, 'artax/query-results.html', {'table': table, 'page_obj': page_obj})
 
 
-@login_required(login_url="login")
-def show_book(request, book_id):
-    book_record = get_object_or_404(Book, pk=book_id)
-    types, authors, locations, languages = Type.objects.all(), Author.objects.all(), Location.objects.all(), Language.objects.all()
+@login_required
+def suggest_books(request):
+    try:
+        limit = max(1, min(int(request.GET.get("limit", suggest.SUGGEST_LIMIT)), 25))
+    except ValueError:
+        limit = suggest.SUGGEST_LIMIT
+    titles, authors = suggest.suggest(request.GET.get("q", ""), limit)
+    return JsonResponse({
+        "titles": [{"id": pk, "title": title, "score": round(score, 3)} for pk, title, score in titles],
+        "authors": [{"id": pk, "name": name, "score": round(score, 3)} for pk, name, score in authors],
+    })
+
+
+@permission_required("artax.view_book", raise_exception=True)
+def book_labels(request):
+    criteria = {key: request.GET.get(key, "").strip() for key in ("lib_from", "lib_to", "location", "book_type")}
+    if not any(criteria.values()):
+        messages.warning(request, "Choose a range of special IDs, a type or a location to print labels for.")
+        return redirect("book_queries")
+    books = labels.select_books(Book.objects.all(), **criteria)
+    if not books:
+        return render(request, "artax/record-404.html", {'param': "book"})
+    response = StreamingHttpResponse(labels.label_sheet_pdf(labels.labels_for(books, request.get_host())),
+                                     content_type="application/pdf")
+    response["Content-Disposition"] = "attachment; filename=labels.pdf"
+    return response
+
+
+@permission_required("artax.view_book", raise_exception=True)
+def export_books(request):
+    export_format = request.GET.get("format", "csv")
+    if export_format not in export.FORMATS:
+        raise Http404("Unknown export format.")
+    books, _ = search.query_books(Book.objects.all(), request.GET)
+    filename = f"books.{export_format}"
+    if isinstance(request, ASGIRequest):
+        # Written out here, in the view's thread, and sent as a file.
+        return FileResponse(export.spool(books, export_format), as_attachment=True, filename=filename,
+                            content_type=export.FORMATS[export_format])
+    response = StreamingHttpResponse(export.export(books, export_format), content_type=export.FORMATS[export_format])
+    response["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+
+def book_detail_version(request, book_id):
+    """
+    The pre-check behind show_book's ETag: one primary-key query with the lookups joined in, so a
+    revalidation is answered before the book's object graph and the dropdown tables are loaded.
+    """
+    return Book.objects.filter(pk=book_id).values_list(*BOOK_DETAIL_VERSION).first()
+
+
+def book_detail_etag(request, book_id):
+    version = book_detail_version(request, book_id)
+    # Pending messages are shown once, so that page must not come from the browser's copy.
+    if version is None or messages.get_messages(request):
+        return None
+    cover = version[1]
+    user = request.user
+    parts = (
+        *version, len(covers.variants(cover)) if cover else 0, reference.version(),
+        # The page carries the layout's user details, permission-dependent forms and the CSRF token.
+        user.pk, user.get_full_name(), user.job, user.is_staff, listings.permission_variant(user),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+    )
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:32]
+
+
+@asyncviews.login_required(login_url="login")
+@asyncviews.cache_control(private=True, no_cache=True)
+# No Last-Modified: covers, summaries and lookup tables change without last_edit_time, and only the ETag
+# covers them, so If-Modified-Since alone must not get a 304.
+@asyncviews.condition(etag_func=sync_to_async(book_detail_etag))
+async def show_book(request, book_id):
+    # The book and the dropdown tables do not depend on each other.
+    book_record, lookups = await asyncio.gather(
+        Book.objects.for_detail().filter(pk=book_id).afirst(), sync_to_async(reference.lookups)(),
+    )
+    if book_record is None:
+        raise Http404("No Book matches the given query.")
     if request.method == "POST":
-        if not request.user.has_perm("artax.change_book"):
+        if not await sync_to_async(request.user.has_perm)("artax.change_book"):
             raise PermissionDenied
-        book_author = Author.objects.get(pk=request.POST.get("author"))
-        book_location = Location.objects.get(pk=request.POST.get("location"))
-        book_language = Language.objects.get(pk=request.POST.get("language"))
+        book_author, book_location, book_language = await asyncio.gather(
+            Author.objects.aget(pk=request.POST.get("author")),
+            Location.objects.aget(pk=request.POST.get("location")),
+            Language.objects.aget(pk=request.POST.get("language")),
+        )
+        await sync_to_async(edit_book)(request, book_record, book_author, book_location, book_language)
+    return await sync_to_async(render)(request, "artax/record-book.html", {"book": book_record, **lookups,
+                                                                           "url_arg": f"{BASE_URL}books%2F{book_id}%2F"
+                                                                           })
+
+
+def edit_book(request, book_record, book_author, book_location, book_language):
+    book_id = book_record.pk
+    with revisions.track(book_record, request.user):
         book_record.author = book_author
-        book_record.locations = book_location
+        book_record.location = book_location
         book_record.language = book_language
         book_record.title = request.POST.get("title")
         book_record.subject = request.POST.get("subject")
@@ -464,16 +597,25 @@ def show_book(request, book_id):
         book_record.last_edit_time = datetime.now()
         book_record.last_editor = request.user
         book_record.save()
-    return render(request, "artax/record-book.html", {"book": book_record, "types": types, "locations": locations,
-                                                      "authors": authors, "languages": languages,
-                                                      "url_arg": f"{BASE_URL}books%2F{book_id}%2F"
-                                                      })
+    book_logger.info("Book %s edited by %s", book_id, request.user.username, extra={
+        "event": "edit", "book_id": book_id, "user_id": request.user.pk, "username": request.user.username,
+    })
+
+
+@login_required(login_url="login")
+def book_history(request, book_id):
+    book = get_object_or_404(Book.objects.only("id"), pk=book_id)
+    page_obj = keyset_page(book.revisions.select_related("editor"), request.GET.get("cursor"), 10, descending=True)
+    return render(request, "artax/book-history.html", {"book": book, "page_obj": page_obj})
 
 
 @permission_required("artax.delete_book", raise_exception=True)
 @login_required(login_url="login")
 def delete_book(request, book_id):
     Book.objects.get(pk=book_id).delete()
+    book_logger.info("Book %s deleted by %s", book_id, request.user.username, extra={
+        "event": "delete", "book_id": book_id, "user_id": request.user.pk, "username": request.user.username,
+    })
     return redirect("all_books")
 
 
@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
 
 
 SECRET_KEY = config('SECRET_KEY')
@@ -49,6 +49,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'artax.middleware.ServerTimingMiddleware',
+    'artax.middleware.MetricsMiddleware',
+    'artax.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,8 +59,31 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'artax.middleware.NPlusOneMiddleware',
 ]
 
+# Report requests that repeat the same query shape N_PLUS_ONE_THRESHOLD times or more (development/tests only).
+N_PLUS_ONE_DETECTION = config('N_PLUS_ONE_DETECTION', default=DEBUG, cast=bool)
+N_PLUS_ONE_THRESHOLD = 5
+N_PLUS_ONE_RAISE = config('N_PLUS_ONE_RAISE', default=False, cast=bool)
+
+# Server-Timing headers and logs/performance.log lines with the SQL, template and total time of each request.
+SERVER_TIMING = config('SERVER_TIMING', default=False, cast=bool)
+# Share of requests (0.0-1.0) run under cProfile; profiles of those slower than the threshold are kept.
+SERVER_TIMING_PROFILE_RATE = config('SERVER_TIMING_PROFILE_RATE', default=0.0, cast=float)
+SERVER_TIMING_PROFILE_THRESHOLD_MS = config('SERVER_TIMING_PROFILE_THRESHOLD_MS', default=500, cast=int)
+SERVER_TIMING_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# Prometheus metrics at /metrics. Each worker process counts into its own memory-mapped file in METRICS_DIR
+# and the endpoint adds them up; the counts of exited workers are folded into a running one's file.
+METRICS_ENABLED = config('METRICS_ENABLED', default=False, cast=bool)
+METRICS_DIR = os.path.join(BASE_DIR, 'cache', 'metrics')
+# Scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN>"; staff users may look when signed in.
+# METRICS_ALLOWED_IPS skips both checks for the listed addresses: behind a reverse proxy every request comes
+# from the proxy's address, so leave it empty there.
+METRICS_TOKEN = config('METRICS_TOKEN', default=None)
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='', cast=Csv())
+
 ROOT_URLCONF = 'zeennylawfirm.urls'
 
 TEMPLATES = [
@@ -82,14 +108,47 @@ WSGI_APPLICATION = 'zeennylawfirm.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# With DB_POOL_SIZE set, each process keeps up to that many connections in a pool shared by its threads
+# (artax.db.pool), which also serves ASGI, where every request runs in a thread of its own. Otherwise each
+# thread keeps its connection for DB_CONN_MAX_AGE seconds, checked before reuse.
+DB_POOL_SIZE = config('DB_POOL_SIZE', default=0, cast=int)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'artax.db.postgresql' if DB_POOL_SIZE else 'django.db.backends.postgresql',
         'NAME': 'artax',
         'USER': 'postgres',
         'PASSWORD': 'marc2006',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Pooled connections go back to the pool at the end of each request.
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'MAX_SIZE': DB_POOL_SIZE,
+            'TIMEOUT': config('DB_POOL_TIMEOUT', default=10.0, cast=float),
+        },
+    }
+}
+
+# Read replicas: one alias per host in DB_REPLICA_HOSTS, each streaming from the primary above. Requests
+# read from them (artax.routers), except a browser that wrote within the last DB_REPLICA_PIN_SECONDS,
+# which reads from the primary until replication has caught up with its writes.
+DATABASE_REPLICAS = []
+for number, host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), 1):
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['artax.routers.ReplicaRouter']
+DB_REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=10, cast=int)
+
+# Shared by every worker process: cached listing pages, and the generation numbers that retire them and
+# the per-worker dropdown tables and suggestion indexes, so that a write in one worker reaches them all.
+# The database cache needs `manage.py createcachetable`; point CACHE_BACKEND and CACHE_LOCATION at Redis
+# (django.core.cache.backends.redis.RedisCache) or Memcached where one runs.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='artax_cache'),
     }
 }
 
@@ -137,16 +196,22 @@ LOGGING = {
             'filters': ['require_debug_false'],
             'include_html': True,
         },
+        # Audit trails: JSON lines written by a background thread (see artax.audit).
         'users': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'artax.audit.QueuedFileHandler',
             'filename': os.path.join(LOGGING_DIR, 'users.log'),
         },
         'books': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'artax.audit.QueuedFileHandler',
             'filename': os.path.join(LOGGING_DIR, 'books.log'),
         },
+        'performance': {
+            'level': 'INFO',
+            'class': 'artax.audit.QueuedFileHandler',
+            'filename': os.path.join(LOGGING_DIR, 'performance.log'),
+        },
     },
     'loggers': {
         'django': {
@@ -163,7 +228,12 @@ LOGGING = {
             'handlers': ['books'],
             'level': 'INFO',
             'propagate': True,
-        }
+        },
+        'performance': {
+            'handlers': ['performance'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
@@ -190,6 +260,14 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Let the front-end server send media after Django's permission check: 'nginx' (X-Accel-Redirect to an
+# internal location aliased to MEDIA_ROOT) or 'apache' (mod_xsendfile). Unset streams from Python.
+MEDIA_SENDFILE_BACKEND = config('MEDIA_SENDFILE_BACKEND', default=None)
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Rendered QR codes, content-addressed by payload and render options.
+QR_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'qr')
+
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 
 LOGIN_URL = "login"